@@ -1,17 +1,44 @@
-import logging
+from FleetState import FleetState
 
 class Battery:
     id_count = -1
     capacity = 1
-    def __init__(self, discharge_rate_ride, discharge_rate_idle, level=1.0, charge_rate=None):
+    def __init__(self, discharge_rate_ride, discharge_rate_idle, level=1.0, charge_rate=None, fleet_state=None, index=None):
         self.next_id()
         self.id = Battery.id_count
 
+        # level and last_update_time are stored in the row index of the fleet state (a private one if not given)
+        if fleet_state is None:
+            fleet_state = FleetState()
+        if index is None:
+            index = fleet_state.add_vehicle(level, -1)
+        self.fleet_state = fleet_state
+        self.index = index
+
         self.charge_rate = charge_rate  # energy per time
         self.discharge_rate_ride = discharge_rate_ride / 1000  # energy per m ride
         self.discharge_rate_idle = discharge_rate_idle / 3600  # energy per s idle
         self.level = level
         self.max_level = 1.0
+        self.last_update_time = None  # start of the idle drain not yet included in level, see BatteryScheduler
+
+    @property
+    def level(self):
+        level = self.fleet_state.battery_level.item(self.index)
+        return int(level) if self.fleet_state.battery_level_is_int.item(self.index) else level  # the type it was set with
+
+    @level.setter
+    def level(self, level):
+        self.fleet_state.set_battery_level(self.index, level)
+
+    @property
+    def last_update_time(self):
+        time = self.fleet_state.last_update_time.item(self.index)
+        return None if time != time else time  # nan for None
+
+    @last_update_time.setter
+    def last_update_time(self, time):
+        self.fleet_state.last_update_time[self.index] = float("nan") if time is None else time
 
     @classmethod
     def reset(cls):
@@ -29,5 +56,16 @@ class Battery:
     def discharge_idle(self, time):
         self.level = max(0, self.level - self.discharge_rate_idle * time)
 
+    def level_at(self, time):
+        """Level at a time, including the idle drain since last_update_time (the battery must be idle)."""
+        if self.last_update_time is None:
+            return self.level
+        return max(0, self.level - self.discharge_rate_idle * (time - self.last_update_time))
+
+    def settle_idle(self, time):
+        """Applies the idle drain since last_update_time to level."""
+        self.level = self.level_at(time)
+        self.last_update_time = time
+
     def total_charge_time(self):
         return (self.capacity - self.level) / self.charge_rate
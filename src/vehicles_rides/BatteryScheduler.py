@@ -0,0 +1,70 @@
+from EventKernel import URGENT, call_later
+
+
+class IdlePeriod:
+    """
+    One idle period of a vehicle, the counterpart of one run of Vehicle.idle in the process model.
+
+    states: "starting" until the period is scheduled, "idle" while it waits for the next threshold crossing,
+    "done" after the crossing or an interrupt.
+    """
+    __slots__ = ("vehicle", "state", "next_level")
+
+    def __init__(self, vehicle):
+        self.vehicle = vehicle
+        self.state = "starting"
+        self.next_level = None
+
+    @property
+    def triggered(self):
+        # same meaning as simpy's Process.triggered, which Vehicle.interrupt_idle_process checks
+        return self.state == "done"
+
+
+class BatteryScheduler:
+    """
+    Fleet level scheduler of the idle battery drain, used instead of one simpy idle process per vehicle.
+
+    The battery level is only evaluated when it is needed: the battery remembers the time of its last update
+    (Battery.last_update_time) and settles the drain when the idle period is interrupted by a ride or a swap. The next
+    swap/bounty threshold crossing of every idle vehicle is a plain timeout with a callback in the event heap of
+    the environment, and crossings of interrupted periods are invalidated lazily: the timeout stays in the heap
+    and is ignored when it fires. No generator is kept per vehicle and no simpy.Interrupt is raised.
+
+    The crossings are kept in the environment's heap rather than a separate one, periods start in urgent
+    events just like simpy process starts, and an interrupt settles the drain at once just like
+    Vehicle.interrupt_idle_process does in the process model, so all events keep the order they have in the
+    process model and a run with a fixed seed gives identical results with both models.
+    """
+    def __init__(self, env):
+        self.env = env
+
+    def start_idle(self, vehicle):
+        """Starts an idle period of a vehicle, returns the period (stored as Vehicle.idle_process)."""
+        period = IdlePeriod(vehicle)
+        call_later(self.env, 0, lambda: self.begin(period), URGENT)  # like the start of a simpy process
+        return period
+
+    def begin(self, period):
+        if period.state != "starting":
+            return  # interrupted before it started
+        vehicle = period.vehicle
+        period.next_level, time_until_next_update = vehicle.next_idle_update()
+        period.state = "idle"
+        vehicle.battery.last_update_time = self.env.now
+        call_later(self.env, time_until_next_update, lambda: self.cross(period))
+
+    def cross(self, period):
+        """The battery of an idle vehicle has reached the next threshold."""
+        if period.state != "idle":
+            return  # lazily invalidated by an interrupt
+        period.vehicle.reach_idle_level(period.next_level)
+        period.state = "done"
+
+    def interrupt(self, period):
+        """Ends an idle period and settles the drain at once."""
+        if period.state == "done":
+            return
+        if period.state == "idle":  # the period had started, drain the battery for the idle time
+            period.vehicle.battery.settle_idle(self.env.now)
+        period.state = "done"
@@ -0,0 +1,131 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+
+class CSRRouter:
+    """
+    Shortest path lengths on a street graph stored as CSR arrays.
+
+    The graph is converted once from the arrays of GraphStore: nodes are replaced by indices, parallel edges are
+    reduced to the shortest one and lengths are stored and summed as float64, like networkx does, so the path
+    lengths are the same as with the "osmnx" backend. Queries run scipy's compiled Dijkstra and only return
+    lengths, no route is materialized. Unreachable nodes get the distance inf.
+    """
+    def __init__(self, arrays):
+        """
+        Args:
+            arrays (dict): Graph arrays as returned by GraphStore.load or GraphStore.graph_to_arrays.
+        """
+        self.node_ids = np.asarray(arrays["node_ids"])
+        num_nodes = len(self.node_ids)
+        # node id -> index lookups use binary search on the sorted ids
+        self.sorted_order = np.argsort(self.node_ids, kind="stable")
+        self.sorted_ids = self.node_ids[self.sorted_order]
+
+        edge_u = np.asarray(arrays["edge_u"], dtype=np.int64)
+        edge_v = np.asarray(arrays["edge_v"], dtype=np.int64)
+        edge_length = np.asarray(arrays["edge_length"], dtype=np.float64)
+
+        # keep the shortest of parallel edges: sort by (u, v, length) and take the first of each (u, v)
+        order = np.lexsort((edge_length, edge_v, edge_u))
+        edge_u, edge_v, edge_length = edge_u[order], edge_v[order], edge_length[order]
+        first = np.ones(len(edge_u), dtype=bool)
+        first[1:] = (edge_u[1:] != edge_u[:-1]) | (edge_v[1:] != edge_v[:-1])
+        edge_u, edge_v, edge_length = edge_u[first], edge_v[first], edge_length[first]
+
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(edge_u, minlength=num_nodes), out=indptr[1:])
+        # built from (data, indices, indptr) so zero length edges are kept as explicit edges
+        self.graph = csr_matrix((edge_length, edge_v.astype(np.int32), indptr), shape=(num_nodes, num_nodes))
+
+    def node_indices(self, nodes):
+        """Converts node ids (scalar or array) to indices in the CSR graph."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        positions = np.searchsorted(self.sorted_ids, nodes)
+        positions = np.minimum(positions, len(self.sorted_ids) - 1)
+        if np.any(self.sorted_ids[positions] != nodes):
+            raise KeyError(f"Node(s) not in the graph: {nodes[self.sorted_ids[positions] != nodes]}")
+        return self.sorted_order[positions]
+
+    def distance(self, origin_node, destination_node):
+        """Returns the shortest path length between two nodes (inf if there is no route)."""
+        origin, destination = self.node_indices([origin_node, destination_node])
+        if origin == destination:
+            return 0.0
+        return float(dijkstra(self.graph, directed=True, indices=origin)[destination])
+
+    def distances(self, origin_node, destination_nodes, limit=np.inf):
+        """
+        Returns the shortest path lengths from one node to many nodes.
+
+        Args:
+            origin_node (int): The source node id.
+            destination_nodes (array-like): The target node ids.
+            limit (float): Stop the search at this distance, targets further away get inf.
+
+        Returns:
+            numpy.ndarray: The distances in the order of destination_nodes.
+        """
+        origin = self.node_indices(origin_node)
+        destinations = self.node_indices(destination_nodes)
+        return dijkstra(self.graph, directed=True, indices=origin, limit=limit)[destinations]
+
+    def distance_matrix(self, origin_nodes, destination_nodes, dtype=np.float32, block_size=256):
+        """
+        Returns the shortest path lengths between all origin and destination nodes.
+
+        The searches are run in blocks of origins so that only block_size full distance rows are held in memory.
+        The lengths are computed as float64 and converted to dtype for storage.
+
+        Returns:
+            numpy.ndarray: A len(origin_nodes) x len(destination_nodes) matrix.
+        """
+        origins = self.node_indices(origin_nodes)
+        destinations = self.node_indices(destination_nodes)
+        matrix = np.empty((len(origins), len(destinations)), dtype=dtype)
+        for start in range(0, len(origins), block_size):
+            block = dijkstra(self.graph, directed=True, indices=origins[start:start + block_size])
+            matrix[start:start + block_size] = block[:, destinations]
+        return matrix
+
+
+if __name__ == "__main__":
+    # Validation against networkx (the routing used by osmnx) on a synthetic grid graph with lengths like OSM
+    # edges: non-integer meters with three decimals, which are not exact in float32
+    import networkx as nx
+    from GraphStore import GraphStore
+
+    rng = np.random.default_rng(0)
+    size = 20
+
+    def osm_length():
+        return round(float(rng.uniform(5, 250)), 3)
+
+    graph = nx.MultiDiGraph(crs="epsg:4326")
+    for i in range(size):
+        for j in range(size):
+            graph.add_node(i * size + j, x=float(i), y=float(j))
+    for i in range(size):
+        for j in range(size):
+            for di, dj in ((1, 0), (0, 1)):
+                if i + di < size and j + dj < size:
+                    a, b = i * size + j, (i + di) * size + j + dj
+                    # some streets are one-way or have parallel edges
+                    graph.add_edge(a, b, length=osm_length())
+                    if rng.random() > 0.1:
+                        graph.add_edge(b, a, length=osm_length())
+                    if rng.random() < 0.1:
+                        graph.add_edge(a, b, length=osm_length())
+
+    router = CSRRouter(GraphStore.graph_to_arrays(graph))
+    nodes = list(graph.nodes)
+    matrix = router.distance_matrix(nodes, nodes, dtype=np.float64, block_size=64)
+    for origin in nodes:
+        lengths = nx.single_source_dijkstra_path_length(graph, origin, weight="length")
+        expected = np.array([lengths.get(node, np.inf) for node in nodes])
+        assert np.array_equal(matrix[nodes.index(origin)], expected)
+        assert np.array_equal(router.distances(origin, nodes), expected)
+        destination = nodes[rng.integers(len(nodes))]
+        assert router.distance(origin, destination) == lengths.get(destination, np.inf)
+    print("CSR routing matches networkx on a %dx%d grid graph" % (size, size))
@@ -1,12 +1,14 @@
-import logging
-from geopy.distance import geodesic
+import numpy as np
 from scipy.stats import truncnorm
 
+import Distance
+
 
 class DataInterface:
-    def __init__(self, env, config):
+    def __init__(self, env, config, map):
         self.env = env
         self.config = config
+        self.map = map
 
         self.task_manager = None
         self.parking_spots = []
@@ -16,38 +18,35 @@ class DataInterface:
         #self.BATTERY_MIN_LEVEL = config["BATTERY_MIN_LEVEL"]
 
     def find_nearest_vehicle(self, location):
-        nearest_vehicle = None
-        min_distance = float('inf')
-
-        for parking_spot in self.parking_spots:
-            available_vehicle = parking_spot.pick_available_vehicle()
-            if available_vehicle:
-                distance = self.calculate_distance(parking_spot.location, location)
-                if distance < min_distance and distance <= self.config['WALK_RADIUS']:
-                    min_distance = distance
-                    nearest_vehicle = available_vehicle
-        return nearest_vehicle
+        """ Returns an available vehicle at the nearest parking spot within walk radius that has one, else None.
+        Only the parking spots within walk radius (from the KD-tree of the map) are checked, each in O(1)."""
+        indices = sorted(self.map.find_nearby_parking_spot_indices(location, self.WALK_RADIUS))
+        parking_spots = [self.parking_spots[i] for i in indices if self.parking_spots[i].has_available_vehicle()]
+        if not parking_spots:
+            return None
+        distances = self.map.calculate_distances(location, [parking_spot.location for parking_spot in parking_spots])
+        return parking_spots[int(np.argmin(distances))].pick_available_vehicle()
     
     def find_nearest_parking_spot(self, location):
         """ Use to get nearest parking spot to certain location.
         TODO: does ps have max cap? only return ps with avialable spots"""
-        nearest_parking_spot = None
-        min_distance = float('inf')
-
-        for parking_spot in self.parking_spots:
-            distance = self.calculate_distance(location, parking_spot.location)
-            if distance < min_distance:
-                nearest_parking_spot = parking_spot
-                min_distance = distance
-        return nearest_parking_spot
+        if not self.parking_spots:
+            return None
+        return self.parking_spots[self.map.find_nearest_parking_spot(location)]
     
-    def vehicle_ride(self, vehicle, destination_parking_spot, given_distance=None):
+    def get_neighbor_parking_spots(self, parking_spot):
+        """ Yields the parking spots within walk radius of parking_spot, nearest first (see Map.build_neighbor_graph)"""
+        for index in self.map.get_neighbor_indices(parking_spot.id).tolist():
+            yield self.parking_spots[index]
+
+    def start_vehicle_ride(self, vehicle):
         # Make vehicle unavailable during the ride
-        vehicle.available = False  
+        vehicle.set_available(False)
         vehicle.status = "riding"
+        if vehicle.task is not None:
+            self.task_manager.update_task(vehicle.task)
 
-        yield self.env.process(vehicle.ride(destination_parking_spot, given_distance))
-        
+    def end_vehicle_ride(self, vehicle, destination_parking_spot):
         # Move vehicle from origin to destination parking spot
         vehicle.parking_spot.remove_vehicle(vehicle)
         destination_parking_spot.add_vehicle(vehicle)
@@ -55,6 +54,8 @@ class DataInterface:
         
         # Update vehicle status
         vehicle.status = "ready"
+        if vehicle.task is not None:
+            self.task_manager.update_task(vehicle.task)  # the task has moved with the vehicle
         
         # Check need for tasks and update availability accordingly
         vehicle.check_maintenance_need()
@@ -77,8 +78,8 @@ class DataInterface:
     @staticmethod
     def calculate_distance(a, b):
         """ Calculates distances between a and b in meters.
-        Method used: Geographic Euclidian distance"""
-        return geodesic((a.lat, a.lon), (b.lat, b.lon)).meters
+        Method used: Haversine distance (see Distance)"""
+        return Distance.location_distance(a, b)
     
 
     @staticmethod
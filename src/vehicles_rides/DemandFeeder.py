@@ -0,0 +1,53 @@
+import Trace
+from EventKernel import URGENT, call_later
+
+
+class DemandFeeder:
+    """
+    Injects riders into the simulation when they depart, instead of starting every rider at t=0.
+
+    The feeder walks through a time-sorted iterable of trips and creates each Rider at its departure time, with
+    one typed callback (see EventKernel.call_later) per departure time. Only the next trip is waiting in the
+    event heap, and a rider is referenced by the simulation only while its trip runs, so memory follows the
+    number of concurrent riders and not the total number of trips. The trips can come from a generator that
+    reads the demand in chunks.
+    """
+    def __init__(self, env, trips, create_rider, tracer=None):
+        """
+        Args:
+            env (simpy.Environment): The simulation environment.
+            trips (iterable): Tuples (departure_time, origin_id, destination_id, target_time, ride_distance),
+                              sorted by departure time.
+            create_rider (callable): Called with the fields of a trip, returns the Rider to start.
+            tracer (Trace.Tracer): The engine's tracer, events are not traced without it.
+        """
+        self.env = env
+        self.trips = trips
+        self.create_rider = create_rider
+        self.tracer = tracer if tracer is not None else Trace.Tracer()
+        self.num_trips = 0
+        self.next_trip = None  # read from trips, waiting for its departure time
+
+    def start(self):
+        self.trips = iter(self.trips)
+        # like the start of a process: an urgent call at once
+        call_later(self.env, 0, self.feed, URGENT)
+
+    def feed(self):
+        """Starts the riders departing now, then waits for the next departure time."""
+        if self.next_trip is not None:
+            self.inject(self.next_trip)
+            self.next_trip = None
+        for trip in self.trips:
+            departure_time = trip[0]
+            if departure_time > self.env.now:
+                self.next_trip = trip
+                call_later(self.env, departure_time - self.env.now, self.feed)
+                return
+            self.inject(trip)
+        if self.tracer.diagnostic:
+            self.tracer.emit(Trace.DEMAND_FEEDER_DONE, self.env.now, self.num_trips)
+
+    def inject(self, trip):
+        self.create_rider(*trip).start()
+        self.num_trips += 1
@@ -0,0 +1,99 @@
+"""
+Straight line distances between one point and many points, vectorized with numpy.
+
+Two kernels replace the per pair geopy.geodesic calls:
+
+- haversine: great circle distance on a sphere with the mean earth radius. Needs no projection. Compared to the
+  WGS84 geodesic the relative error is below 0.5% everywhere and below 0.35% for latitudes under 60 degrees
+  (at most a few meters over a city).
+- projected: euclidean distance in a UTM projection (Map uses the projection set up by create_kdtree). Within the
+  UTM zone of the projection the scale factor is between 0.9996 and 1.001, so the relative error against the
+  geodesic is below 0.1% (below 1 m per km).
+
+Both are far below the error of using a straight line instead of the street network, which is what the callers
+use these distances for (nearest searches and the detour factor fallback of the routing).
+"""
+
+import math
+
+import numpy as np
+
+
+EARTH_RADIUS = 6371008.8  # mean earth radius in meters (IUGG)
+
+
+def haversine(lon, lat, lons, lats):
+    """
+    Great circle distances from one point to many points.
+
+    Args:
+        lon (float): Longitude of the origin.
+        lat (float): Latitude of the origin.
+        lons (array-like): Longitudes of the destinations.
+        lats (array-like): Latitudes of the destinations.
+
+    Returns:
+        numpy.ndarray: The distances in meters, in the order of the destinations.
+    """
+    lat = math.radians(lat)
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    dlons = np.radians(np.asarray(lons, dtype=np.float64) - lon)
+    h = np.sin((lats - lat) / 2) ** 2 + math.cos(lat) * np.cos(lats) * np.sin(dlons / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+
+def projected(proj, lon, lat, lons, lats):
+    """
+    Euclidean distances from one point to many points in a projection.
+
+    Args:
+        proj (pyproj.Proj): A metric projection, e.g. Map.get_utm_proj_from_lon.
+        lon (float): Longitude of the origin.
+        lat (float): Latitude of the origin.
+        lons (array-like): Longitudes of the destinations.
+        lats (array-like): Latitudes of the destinations.
+
+    Returns:
+        numpy.ndarray: The distances in meters, in the order of the destinations.
+    """
+    x, y = proj(lon, lat)
+    xs, ys = proj(np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+    return np.hypot(xs - x, ys - y)
+
+
+def location_distance(a, b):
+    """Haversine distance in meters between two locations, without numpy overhead for single pairs."""
+    lat_a, lat_b = math.radians(a.lat), math.radians(b.lat)
+    h = math.sin((lat_b - lat_a) / 2) ** 2 + math.cos(lat_a) * math.cos(lat_b) * math.sin(math.radians(b.lon - a.lon) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(h, 1.0)))
+
+
+def location_coordinates(locations):
+    """Returns the longitudes and latitudes of a list of locations as two float64 arrays."""
+    lons = np.fromiter((location.lon for location in locations), dtype=np.float64, count=len(locations))
+    lats = np.fromiter((location.lat for location in locations), dtype=np.float64, count=len(locations))
+    return lons, lats
+
+
+if __name__ == "__main__":
+    # Accuracy check at city scale against WGS84 geodesic distances in meters (computed once with Karney's algorithm,
+    # as geopy.distance.geodesic and pyproj.Geod do), from the center to points up to 0.2 degrees away
+    from pyproj import Proj
+
+    reference = {
+        (18.07, 59.33): [(18.270, 59.430, 15916.588), (17.870, 59.230, 15940.374), (18.270, 59.330, 11384.873),
+                         (18.070, 59.230, 11139.996), (17.940, 59.400, 10745.242), (18.074, 59.332, 318.565)],
+        (-1.40, 50.91): [(-1.200, 51.010, 17922.256), (-1.600, 50.810, 17945.777), (-1.200, 50.910, 14066.675),
+                         (-1.400, 50.810, 11124.559), (-1.530, 50.980, 12004.889), (-1.396, 50.912, 358.676)],
+        (10.75, 59.91): [(10.950, 60.010, 15778.830), (10.550, 59.810, 15802.555), (10.950, 59.910, 11190.294),
+                         (10.750, 59.810, 11140.990), (10.620, 59.980, 10659.100), (10.754, 59.912, 315.809)],
+        (2.35, 48.86): [(2.550, 48.960, 18401.308), (2.150, 48.760, 18424.491), (2.550, 48.860, 14675.327),
+                        (2.350, 48.760, 11120.606), (2.220, 48.930, 12307.069), (2.354, 48.862, 368.254)],
+    }
+    for (lon, lat), points in reference.items():
+        lons, lats, expected = np.array(points).T
+        proj = Proj(proj='utm', zone=int((lon + 180) / 6) + 1, ellps='WGS84', preserve_units=False)
+        haversine_error = np.max(np.abs(haversine(lon, lat, lons, lats) - expected) / expected)
+        projected_error = np.max(np.abs(projected(proj, lon, lat, lons, lats) - expected) / expected)
+        assert haversine_error < 0.005 and projected_error < 0.001
+        print("[%.2f, %.2f] max relative error haversine: %.5f, projected: %.5f" % (lon, lat, haversine_error, projected_error))
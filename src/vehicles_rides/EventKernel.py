@@ -0,0 +1,350 @@
+"""
+A small discrete event kernel that can replace simpy.Environment in RideSimulationEngine (ENGINE "kernel").
+
+It implements only what the model uses: timeouts, generator processes (also yielded by other processes),
+interrupts, plain events with callbacks and run(until), plus typed callbacks: plain functions scheduled with
+call_later, without an event object. The heap holds (time, priority, id, item) tuples where the item is a
+callback or an event (events are callable), and they are processed in exactly the order simpy processes
+events (urgent before normal at the same time, then by scheduling order), so a run with a fixed seed gives
+the same results as with simpy.
+
+Generator processes cost about the same as in simpy: most of the time goes to resuming the generator. The
+frequent model events (rider departure, ride end, park end, demand injection, idle battery start and threshold
+crossing) are therefore typed callbacks scheduled through the module function call_later, which works with both
+engines, and only the rare ones (fleet specialists, state samples, the "process" battery model) remain processes.
+
+Interrupts raise simpy's Interrupt exception, so model code catches it the same way with both engines.
+"""
+
+from heapq import heappop, heappush
+
+from simpy.exceptions import Interrupt
+
+URGENT = 0  # same priorities as simpy
+NORMAL = 1
+
+PENDING = object()
+
+
+class Event:
+    __slots__ = ("env", "callbacks", "_value", "_ok", "_defused")
+
+    def __init__(self, env):
+        self.env = env
+        self.callbacks = []
+        self._value = PENDING
+        self._ok = None
+        self._defused = False
+
+    @property
+    def triggered(self):
+        return self._value is not PENDING
+
+    @property
+    def processed(self):
+        return self.callbacks is None
+
+    @property
+    def ok(self):
+        return self._ok
+
+    @property
+    def value(self):
+        if self._value is PENDING:
+            raise AttributeError(f"Value of {self} is not yet available")
+        return self._value
+
+    def __call__(self):
+        """Processes the event, called by the kernel when the event is popped from the heap."""
+        callbacks, self.callbacks = self.callbacks, None
+        for callback in callbacks:
+            callback(self)
+        if not self._ok and not self._defused:
+            exception = type(self._value)(*self._value.args)
+            exception.__cause__ = self._value
+            raise exception
+
+    def succeed(self, value=None):
+        if self._value is not PENDING:
+            raise RuntimeError(f"{self} has already been triggered")
+        self._ok = True
+        self._value = value
+        self.env.schedule(self)
+        return self
+
+    def fail(self, exception):
+        if self._value is not PENDING:
+            raise RuntimeError(f"{self} has already been triggered")
+        self._ok = False
+        self._value = exception
+        self.env.schedule(self)
+        return self
+
+
+class Timeout(Event):
+    __slots__ = ()
+
+    def __init__(self, env, delay, value=None):
+        if delay < 0:
+            raise ValueError(f"Negative delay {delay}")
+        self.env = env
+        self.callbacks = []
+        self._value = value
+        self._ok = True
+        self._defused = False
+        # env.schedule inlined, timeouts are the most frequent events
+        env.eid += 1
+        heappush(env.queue, (env.now + delay, NORMAL, env.eid, self))
+
+
+class Initialize(Event):
+    __slots__ = ()
+
+    def __init__(self, env, process):
+        self.env = env
+        self.callbacks = [process._resume]
+        self._value = None
+        self._ok = True
+        self._defused = False
+        env.schedule(self, URGENT)
+
+
+class Interruption(Event):
+    __slots__ = ("process",)
+
+    def __init__(self, process, cause):
+        self.env = process.env
+        self.callbacks = [self._interrupt]
+        self._value = Interrupt(cause)
+        self._ok = False
+        self._defused = True
+        if process._value is not PENDING:
+            raise RuntimeError(f"{process} has terminated and cannot be interrupted.")
+        if process is self.env.active_process:
+            raise RuntimeError("A process is not allowed to interrupt itself.")
+        self.process = process
+        self.env.schedule(self, URGENT)
+
+    def _interrupt(self, event):
+        if self.process._value is not PENDING:
+            return  # the process has terminated in the meantime
+        self.process._target.callbacks.remove(self.process._resume)
+        self.process._resume(self)
+
+
+class Process(Event):
+    __slots__ = ("_generator", "_target")
+
+    def __init__(self, env, generator):
+        if not hasattr(generator, "throw"):
+            raise ValueError(f"{generator} is not a generator.")
+        Event.__init__(self, env)
+        self._generator = generator
+        self._target = Initialize(env, self)
+
+    @property
+    def target(self):
+        return self._target
+
+    @property
+    def is_alive(self):
+        return self._value is PENDING
+
+    def interrupt(self, cause=None):
+        Interruption(self, cause)
+
+    def _resume(self, event):
+        env = self.env
+        env.active_process = self
+        generator = self._generator
+        while True:
+            try:
+                if event._ok:
+                    event = generator.send(event._value)
+                else:
+                    event._defused = True
+                    exception = type(event._value)(*event._value.args)
+                    exception.__cause__ = event._value
+                    event = generator.throw(exception)
+            except StopIteration as stop:
+                event = None
+                self._ok = True
+                self._value = stop.args[0] if stop.args else None
+                env.schedule(self)
+                break
+            except BaseException as exception:
+                event = None
+                self._ok = False
+                self._value = exception
+                env.schedule(self)
+                break
+
+            callbacks = event.callbacks
+            if callbacks is not None:
+                callbacks.append(self._resume)
+                break
+            # the yielded event has already been processed, continue with its value right away
+
+        self._target = event
+        env.active_process = None
+
+
+def call_later(env, delay, callback, priority=NORMAL):
+    """
+    Calls callback() after delay, with simpy.Environment or EventKernel.
+
+    On EventKernel this is a typed callback. On simpy it goes through the public API, scheduled at the same moment
+    and priority, so both engines process it in the same order: a normal priority call is a timeout with the
+    callback, an urgent call (only with delay 0) the start of a process that calls it.
+    """
+    if isinstance(env, EventKernel):
+        env.call_later(delay, callback, priority)
+    elif priority == URGENT:
+        if delay != 0:
+            raise ValueError("Urgent calls are only supported without a delay")
+        env.process(call_at_start(callback))
+    else:
+        env.timeout(delay).callbacks.append(lambda event: callback())
+
+
+def call_at_start(callback):
+    callback()
+    return
+    yield  # a generator, for env.process
+
+
+class EventKernel:
+    """The environment: current time, the event heap and the subset of simpy.Environment's API the model uses."""
+    def __init__(self, initial_time=0):
+        self.now = initial_time
+        self.active_process = None
+        self.queue = []
+        self.eid = 0
+
+    def schedule(self, event, priority=NORMAL, delay=0):
+        self.eid += 1
+        heappush(self.queue, (self.now + delay, priority, self.eid, event))
+
+    def call_later(self, delay, callback, priority=NORMAL):
+        """Calls callback() after delay, a typed callback: no event object is created."""
+        self.eid += 1
+        heappush(self.queue, (self.now + delay, priority, self.eid, callback))
+
+    def event(self):
+        return Event(self)
+
+    def timeout(self, delay, value=None):
+        return Timeout(self, delay, value)
+
+    def process(self, generator):
+        return Process(self, generator)
+
+    def peek(self):
+        return self.queue[0][0] if self.queue else float("inf")
+
+    def step(self):
+        self.now, _, _, item = heappop(self.queue)
+        item()
+
+    def run(self, until=None):
+        """Runs until the queue is empty or until the time until (events at until itself are not processed)."""
+        stop = None
+        if until is not None:
+            if until <= self.now:
+                raise ValueError(f"until ({until}) must be greater than the current simulation time")
+            # like simpy: an urgent event at until, scheduled now, ends the run
+            stop = Event(self)
+            stop._ok = True
+            stop._value = None
+            self.schedule(stop, URGENT, until - self.now)
+
+        # the loop body is step, inlined
+        queue = self.queue
+        while queue:
+            now, _, _, item = heappop(queue)
+            self.now = now
+            if item is stop:
+                return None
+            item()
+        if stop is not None:
+            raise RuntimeError(f'No scheduled events left but "until" event was not triggered: {stop}')
+
+
+if __name__ == "__main__":
+    # Benchmark against simpy on a synthetic rider/vehicle workload: riders as generator processes with nested
+    # processes and interrupts, and the same workload with typed callbacks and lazily invalidated idle timers
+    import random
+    import time
+
+    import simpy
+
+    def idle(env, vehicle, trace):
+        try:
+            yield env.timeout(random.randint(3000, 9000))
+            trace.append((env.now, "threshold", vehicle))
+        except Interrupt:
+            trace.append((env.now, "interrupted", vehicle))
+
+    def ride(env, duration):
+        yield env.timeout(duration)
+
+    def rider(env, departure, vehicle, idle_processes, trace):
+        yield env.timeout(departure)
+        process = idle_processes[vehicle]
+        if process.is_alive:
+            process.interrupt("ride")
+        yield env.process(ride(env, random.randint(60, 1200)))
+        yield env.timeout(30)
+        idle_processes[vehicle] = env.process(idle(env, vehicle, trace))
+        trace.append((env.now, "parked", vehicle))
+
+    def simulate_processes(env, num_riders, num_vehicles, trace):
+        idle_processes = [env.process(idle(env, vehicle, trace)) for vehicle in range(num_vehicles)]
+        for _ in range(num_riders):
+            env.process(rider(env, random.randint(0, 30 * 24 * 3600), random.randrange(num_vehicles), idle_processes, trace))
+
+    def simulate_callbacks(env, num_riders, num_vehicles, trace):
+        idle_periods = [0] * num_vehicles  # number of the current idle period of each vehicle
+        idle = [False] * num_vehicles  # idle and the threshold not yet crossed
+
+        def start_idle(vehicle):
+            idle_periods[vehicle] += 1
+            idle[vehicle] = True
+            period = idle_periods[vehicle]
+            call_later(env, random.randint(3000, 9000), lambda: cross(vehicle, period))
+
+        def cross(vehicle, period):
+            if idle_periods[vehicle] == period and idle[vehicle]:  # else the period was interrupted
+                idle[vehicle] = False
+                trace.append((env.now, "threshold", vehicle))
+
+        def depart(vehicle):
+            if idle[vehicle]:
+                idle[vehicle] = False
+                trace.append((env.now, "interrupted", vehicle))
+            call_later(env, random.randint(60, 1200), lambda: call_later(env, 30, lambda: park(vehicle)))
+
+        def park(vehicle):
+            start_idle(vehicle)
+            trace.append((env.now, "parked", vehicle))
+
+        for vehicle in range(num_vehicles):
+            start_idle(vehicle)
+        for _ in range(num_riders):
+            departure, vehicle = random.randint(0, 30 * 24 * 3600), random.randrange(num_vehicles)
+            call_later(env, departure, lambda vehicle=vehicle: depart(vehicle))
+
+    def simulate(env, workload, num_riders=100000, num_vehicles=1000):
+        random.seed(42)
+        trace = []
+        workload(env, num_riders, num_vehicles, trace)
+        start = time.perf_counter()
+        env.run(31 * 24 * 3600)
+        return trace, time.perf_counter() - start
+
+    for workload in (simulate_processes, simulate_callbacks):
+        simpy_trace, simpy_time = simulate(simpy.Environment(), workload)
+        kernel_trace, kernel_time = simulate(EventKernel(), workload)
+        assert simpy_trace == kernel_trace
+        print("%-18s identical traces of %d records, simpy %.2f s, kernel %.2f s, speedup %.2fx"
+              % (workload.__name__, len(kernel_trace), simpy_time, kernel_time, simpy_time / kernel_time))
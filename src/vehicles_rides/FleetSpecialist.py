@@ -1,7 +1,11 @@
-import logging
-from geopy.distance import geodesic
+import Trace
 from shapely.geometry import shape, Point
+from shapely.prepared import prep
 import json
+import numpy as np
+
+import Distance
+import Tour
 
 
 class FleetSpecialist:
@@ -15,6 +19,7 @@ class FleetSpecialist:
         self.map = map
         self.config = config
         self.results = results 
+        self.tracer = results.tracer
         self.data_interface = data_interface
         self.task_manager = task_manager
 
@@ -26,13 +31,20 @@ class FleetSpecialist:
             with open(focus_area_path, "r") as file:
                 area = file.read()
             area_dict = json.loads(area)
-            self.focus_area = shape(area_dict)
+            self.focus_area = prep(shape(area_dict))
+        self.focus_area_spots = {}  # parking_spot_id -> location is in the focus area
         
         # Work planing
         self.planed_tasks = []
         self.next_task = None 
         self.busy = False     # on the way, working, planing
-        self.optimize = False
+        self.optimize = self.config.get("OPTIMIZE_DISPATCH", False)  # nearest task by driving distance
+        # "specialist": each specialist plans its own next task, "global": the task manager assigns tasks to all waiting specialists
+        self.global_dispatch = self.config.get("DISPATCH_MODE", "specialist") == "global"
+        # plan multi-stop tours of up to TOUR_MAX_STOPS tasks (and num_batteries) instead of one task at a time,
+        # a tour reserves its tasks for this specialist, None plans tours of up to num_batteries tasks
+        self.tour_planning = self.config.get("TOUR_PLANNING", False)
+        self.TOUR_MAX_STOPS = self.config.get("TOUR_MAX_STOPS", 10)
 
         # Parameters
         self.DRIVING_SPEED = self.config["AVG_FLEET_SPECIALIST_TRAVEL_SPEED"] / 3.6  # m/s
@@ -40,6 +52,8 @@ class FleetSpecialist:
         self.TASK_RESOLUTION_TIME_MULTIPLE = self.config["TIME_PER_SWAP_MULTIPLE"]
         self.REFILL_VAN_BATTERIES_TIME = self.config["REFILL_VAN_BATTERIES_TIME"]
         self.VAN_BATTERY_CAPACITY = self.config["VAN_BATTERY_CAPACITY"]
+        self.DRIVE_SEARCH_RADIUS = self.config.get("DRIVE_SEARCH_RADIUS")  # m, optional cap for find_nearest_task_drive
+        self.TASK_CHECK_INTERVAL = self.config.get("TASK_CHECK_INTERVAL", 30)  # s, between checks for tasks while waiting
         
         # Management Parameters
         #self.shift_end = None
@@ -66,22 +80,24 @@ class FleetSpecialist:
 
     def calculate_distance(self, destination):
         """ Calculates distances to destination
-        Method used: Geographic Euclidian distance"""
-        distance = geodesic((self.location.lat, self.location.lon), (destination.lat, destination.lon)).meters
-        return distance
+        Method used: Haversine distance (see Distance)"""
+        return Distance.location_distance(self.location, destination)
 
     def drive_to(self, destination):
         distance = self.map.get_drive_distance(self.location, destination)
         self.task_distance_driven = distance
         travel_time = round(distance / self.DRIVING_SPEED)
-        logging.info("[%.0f] Fleet Specialist %d is driving from location [%.4f, %.4f]" % (self.env.now, self.id, self.location.lon, self.location.lat))
+        if self.tracer.fleet:
+            self.tracer.emit(Trace.FLEET_SPECIALIST_DRIVING, self.env.now, self.id, self.location.lon, self.location.lat)
         yield self.env.timeout(travel_time)  # Simulate travel time
-        logging.info("[%.0f] Fleet Specialist %d arrived at location [%.4f, %.4f]" % (self.env.now, self.id, destination.lon, destination.lat))
+        if self.tracer.fleet:
+            self.tracer.emit(Trace.FLEET_SPECIALIST_ARRIVED, self.env.now, self.id, destination.lon, destination.lat)
         self.location = destination
 
     def resolve_task(self):
         # Working... (Task resolution time, longer for isolated tasks / first task in a cluster)
         self.next_task.status = "pending"
+        self.task_manager.update_task(self.next_task)
         if self.task_distance_driven != 0:
             yield self.env.timeout(self.TASK_RESOLUTION_TIME_SINGLE)
         else:
@@ -102,7 +118,9 @@ class FleetSpecialist:
         self.task_manager.save_task(self.next_task, self, self.env.now)
         self.next_task.vehicle.resume_idle()
 
-        logging.info("[%.0f] Task %d resolved by swapping to a full battery at location [%.4f, %.4f]" % (self.env.now, self.next_task.id, self.next_task.location.lon, self.next_task.location.lat))
+        if self.tracer.fleet:
+            self.tracer.emit(Trace.TASK_RESOLVED, self.env.now, self.next_task.id, self.next_task.location.lon,
+                              self.next_task.location.lat)
 
     
     def schedule(self):
@@ -112,7 +130,8 @@ class FleetSpecialist:
         # waits until its the hour to initialize user
         yield self.env.timeout(self.start_time)
         self.task_manager.add_fleet_specialist(self)
-        logging.info("[%.0f] Fleet Specialist %d initialized at location [%.4f, %.4f]" % (self.env.now, self.id, self.location.lon, self.location.lat))
+        if self.tracer.fleet:
+            self.tracer.emit(Trace.FLEET_SPECIALIST_INITIALIZED, self.env.now, self.id, self.location.lon, self.location.lat)
 
     def work_flow(self):
 
@@ -124,10 +143,15 @@ class FleetSpecialist:
         while True:
             while self.num_batteries > 0:
             # 1. check if there are any tasks 
-                if self.task_manager.get_available_tasks():
+                if self.planed_tasks or self.task_manager.has_available_tasks():
                     log_inactivity = True
                     # 2. Find the next task
-                    self.plan_next_task()
+                    if self.global_dispatch:
+                        self.next_task = yield self.task_manager.request_task(self)
+                    else:
+                        self.plan_next_task()
+                    if self.next_task is None:
+                        continue  # the other specialists got the available tasks, or the planned ones were ridden away
                     self.task_start_time = self.env.now
                     # 3. Drive to next task
                     yield self.env.process(self.drive_to(self.next_task.location))
@@ -138,59 +162,155 @@ class FleetSpecialist:
                     # - task is not already resolved
                     # - task location is the same as current location (has moved)
                     # - and if vehicle is not riding
-                    if self.next_task.status == "active" and self.next_task.location == self.location and self.next_task.vehicle.status != "riding":
+                    if self.next_task.status in ("active", "assigned") and self.next_task.location == self.location and self.next_task.vehicle.status != "riding":
                         # 5. Reslove task
                         self.next_task.vehicle.interrupt_idle_process("Idle interrupted due to Battery Swap")
                         yield self.env.process(self.resolve_task())
                     else:
-                        logging.info("[%.0f] Fleet specilist %d missed task." % (self.env.now, self.id))
+                        if self.tracer.fleet:
+                            self.tracer.emit(Trace.FLEET_SPECIALIST_MISSED_TASK, self.env.now, self.id)
+                        if self.next_task.status == "assigned":
+                            self.task_manager.release_task(self.next_task)
                     # 6. Redo: Plan next task 
                 else:
                     if log_inactivity:
-                        logging.info("[%.0f] Fleet Specialist %d is waiting for tasks" % (self.env.now, self.id))
+                        if self.tracer.fleet:
+                            self.tracer.emit(Trace.FLEET_SPECIALIST_WAITING, self.env.now, self.id)
                         log_inactivity = False
-                    yield self.env.timeout(30)  # Wait for 30 seconds if no tasks are available
+                    # Sleep until a task becomes available, then check at the next check interval as when polling
+                    check_time = self.env.now
+                    yield self.task_manager.wait_for_task()
+                    yield self.env.timeout(self.next_check_delay(check_time))
             # refill batteries at WH
             yield self.env.process(self.refill_batteries())
 
+    def next_check_delay(self, check_time):
+        """ Time until the next check for tasks, the checks are every TASK_CHECK_INTERVAL seconds from check_time """
+        delay = (check_time - self.env.now) % self.TASK_CHECK_INTERVAL
+        if delay == 0 and self.env.now == check_time:
+            # the task appeared after the check at this time
+            delay = self.TASK_CHECK_INTERVAL
+        return delay
+
     def refill_batteries(self):
         """ Simplified process of refilling batteries at warehouse """
-        logging.info("[%.0f] Fleet Specialist %d is out of batteries, will go and refill att WH" % (self.env.now, self.id))
+        if self.tracer.fleet:
+            self.tracer.emit(Trace.FLEET_SPECIALIST_REFILLING, self.env.now, self.id)
         yield self.env.timeout(self.REFILL_VAN_BATTERIES_TIME) # it takes 40 min to drive to WH and refill batteries
         self.num_batteries = self.VAN_BATTERY_CAPACITY
-        logging.info("[%.0f] Fleet Specialist %d has now replenished batteries" % (self.env.now, self.id))
+        if self.tracer.fleet:
+            self.tracer.emit(Trace.FLEET_SPECIALIST_REFILLED, self.env.now, self.id)
 
     def plan_next_task(self):
-        # Get tasks that are not currently planned
-        available_tasks = self.task_manager.get_available_tasks()
-        # focus on tasks in certain area
-        if self.focus_area:
-            # Filter tasks based on the focus area polygon
-            tasks_in_focus_area = {task for task in available_tasks if self.focus_area.contains(Point(task.location.lon, task.location.lat))}
-            # if there are none in focus area, go outside.
-            if tasks_in_focus_area:
-                available_tasks = tasks_in_focus_area
-
+        if self.tour_planning:
+            self.next_task = self.next_tour_stop()
+            return
         if not self.planed_tasks:
             if self.optimize:
+                # Get tasks that are not currently planned
+                available_tasks = list(self.task_manager.iter_available_tasks())
+                # focus on tasks in certain area, if there are none in focus area, go outside.
+                if self.focus_area:
+                    tasks_in_focus_area = [task for task in available_tasks if self.in_focus_area(task.location)]
+                    if tasks_in_focus_area:
+                        available_tasks = tasks_in_focus_area
                 # Find the nearest task based on driving distance and plan it
                 nearest_task = self.find_nearest_task_drive(available_tasks)
             else:
                 # Find the nearest task based on geographic distance and plan it
-                nearest_task = self.find_nearest_task(available_tasks)
+                nearest_task = self.find_nearest_task()
             self.planed_tasks.append(nearest_task)
 
         self.next_task = self.planed_tasks.pop()
 
-    def find_nearest_task(self, tasks):
-        # Find the nearest task based on geographic distance
-        return min(tasks, key=lambda task: self.calculate_distance(task.location))
-    """
-    Complexity improvments
-    1. Sorted Lists with Binary Search: Using two sorted lists (one sorted by latitude and the other by longitude) could be a practical solution. You can use binary search for efficient querying and insertion. Python's bisect module can help manage these operations efficiently. This approach allows relatively quick updates and reasonably efficient queries, especially if you optimize the search by checking nearby elements after a binary search to refine which task is closest.
-    2. Grid Hashing (Spatial Hashing): This method involves dividing the space into a grid and assigning tasks to buckets based on their coordinates. This can significantly reduce the search space for queries, as you only need to check the bucket corresponding to the query location and its adjacent buckets. Insertions and deletions are straightforward as they involve adding or removing tasks from these buckets. This method can be particularly effective if the tasks are somewhat evenly distributed across the area.
-    Given the equal frequency of updates and queries, grid hashing might offer the best balance between ease of updates and efficient querying. It simplifies the management of dynamic datasets and can provide fast access to nearby tasks without the overhead of maintaining tree structures or multiple sorted lists. This approach scales well with the number of tasks and can handle frequent changes in the dataset efficiently.
-    """
+    def next_tour_stop(self):
+        """ Returns the next valid stop of the planned tour, plans a new tour when it is done. None if there is no task.
+        A stop whose vehicle is being ridden is dropped from the tour and released to the other specialists. """
+        while True:
+            if not self.planed_tasks:
+                if not self.task_manager.has_available_tasks():
+                    return None
+                self.plan_tour()
+            task = self.planed_tasks.pop()
+            if task.status == "assigned" and task.vehicle.status != "riding":
+                return task
+            if task.status == "assigned":
+                self.task_manager.release_task(task)
+
+    def plan_tour(self):
+        """ Plans a tour over the nearest available tasks (in the focus area if there are any there), ordered by
+        nearest neighbour and 2-opt on the distances between the stops (by road if optimize is set). The tasks
+        are reserved for this specialist, see TaskManager.assign_task. """
+        num_stops = self.num_batteries if self.TOUR_MAX_STOPS is None else min(self.num_batteries, self.TOUR_MAX_STOPS)
+        tasks = []
+        if self.focus_area:
+            tasks = self.task_manager.find_nearest_tasks(self.location, num_stops, accept=lambda task: self.in_focus_area(task.location))
+        if not tasks:
+            tasks = self.task_manager.find_nearest_tasks(self.location, num_stops)
+
+        locations = [self.location] + [task.location for task in tasks]
+        if self.optimize:
+            distances = np.vstack([self.map.get_drive_distances(location, locations) for location in locations])
+        else:
+            lons, lats = Distance.location_coordinates(locations)
+            distances = np.vstack([Distance.haversine(location.lon, location.lat, lons, lats) for location in locations])
+        route = Tour.plan_route(distances)
+
+        for task in tasks:
+            self.task_manager.assign_task(task)
+        # planed_tasks is used as a stack, the first stop goes last
+        self.planed_tasks = [tasks[node - 1] for node in reversed(route[1:])]
+        if self.tracer.diagnostic:
+            self.tracer.emit(Trace.TOUR_PLANNED, self.env.now, self.id, len(tasks))
+
+    def in_focus_area(self, location):
+        """ Checks if a location is in the focus area, cached per parking spot """
+        if location.parking_spot_id is None:
+            return self.focus_area.contains(Point(location.lon, location.lat))
+        inside = self.focus_area_spots.get(location.parking_spot_id)
+        if inside is None:
+            inside = self.focus_area_spots[location.parking_spot_id] = self.focus_area.contains(Point(location.lon, location.lat))
+        return inside
+
+    def find_nearest_task(self):
+        # Find the nearest available task based on geographic distance, with the task manager's spatial index
+        nearest_tasks = []
+        if self.focus_area:
+            nearest_tasks = self.task_manager.find_nearest_tasks(self.location, accept=lambda task: self.in_focus_area(task.location))
+        if not nearest_tasks:
+            nearest_tasks = self.task_manager.find_nearest_tasks(self.location)
+        return nearest_tasks[0]
+
+    def dispatch_costs(self, tasks, lons, lats):
+        """ Row of the global dispatch cost matrix: the distance to each task, by road if optimize is set else
+        straight line. With a focus area all tasks outside it cost more than any task inside it (if there is one).
+
+        Args:
+            tasks (list): The available tasks.
+            lons (numpy.ndarray): Longitudes of the task locations.
+            lats (numpy.ndarray): Latitudes of the task locations.
+
+        Returns:
+            numpy.ndarray: The costs in the order of tasks.
+        """
+        if self.optimize:
+            costs = self.map.get_drive_distances(self.location, [task.location for task in tasks])
+        else:
+            costs = Distance.haversine(self.location.lon, self.location.lat, lons, lats)
+        if self.focus_area:
+            outside = np.array([not self.in_focus_area(task.location) for task in tasks])
+            if not outside.all() and np.isfinite(costs).any():
+                costs = np.where(outside, costs + costs[np.isfinite(costs)].max() + 1, costs)
+        return costs
+
     def find_nearest_task_drive(self, tasks):
-        # Find the nearest task based on driving distance
-        return min(tasks, key=lambda task: self.map.get_drive_distance(self.location, task.location)) 
+        # Find the nearest task based on driving distance, one search from the current location for all tasks
+        tasks = list(tasks)
+        task_locations = [task.location for task in tasks]
+        if self.DRIVE_SEARCH_RADIUS is not None:
+            distances = self.map.get_drive_distances(self.location, task_locations, self.DRIVE_SEARCH_RADIUS)
+            if np.isfinite(distances).any():
+                return tasks[int(np.argmin(distances))]
+        # no task within the radius (or no radius), search without a cap
+        distances = self.map.get_drive_distances(self.location, task_locations)
+        return tasks[int(np.argmin(distances))] 
@@ -0,0 +1,202 @@
+import numpy as np
+
+
+class FleetState:
+    """
+    Structure of arrays holding the state of all vehicles, one row per vehicle.
+
+    Vehicle and Battery keep their attributes (status, task, parking_spot, level, last_update_time) but store them
+    here, at the row of the vehicle, so fleet wide metrics and bulk updates are single numpy operations instead of
+    loops over the vehicle objects. The arrays grow by doubling when vehicles are added beyond the capacity.
+
+    The battery level, task flag and parking spot are written through set_battery_level, set_task and
+    set_parking_spot, which also keep online accumulators up to date: the sum of the battery levels, the number of
+    bounties, the number of vehicles per parking spot and how many parking spots have each number of vehicles.
+    The snapshot metrics (avg_battery_level, num_bounties, vehicle_distribution_gini) are read from them without
+    touching the arrays, in O(1) or O(largest number of vehicles at a parking spot).
+
+    A battery level that was set as an int (e.g. 0 from max(0, ...)) is flagged in battery_level_is_int and read
+    back as an int by Battery.level, so the result files get the same text as when the level was an attribute.
+    """
+    STATUSES = ("ready", "riding", "bounty")  # vehicle status codes are indices into this tuple
+    STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+    # task flag codes
+    NO_TASK = 0
+    TASK = 1
+    BOUNTY_TASK = 2
+
+    def __init__(self, capacity=0):
+        """
+        Args:
+            capacity (int): Number of vehicles to allocate the arrays for.
+        """
+        self.size = 0
+        self.battery_level = np.zeros(capacity, dtype=np.float64)
+        self.battery_level_is_int = np.zeros(capacity, dtype=bool)
+        self.last_update_time = np.full(capacity, np.nan)  # nan for None, see Battery.last_update_time
+        self.status = np.zeros(capacity, dtype=np.int8)
+        self.parking_spot = np.full(capacity, -1, dtype=np.int32)  # parking spot id, -1 for none
+        self.task = np.zeros(capacity, dtype=np.int8)
+
+        # online accumulators
+        self.battery_sum = 0.0
+        self.bounty_count = 0
+        self.spot_counts = []       # parking spot id -> number of vehicles
+        self.count_histogram = [0]  # number of vehicles -> number of parking spots with that many (from 1 up)
+
+    def __len__(self):
+        return self.size
+
+    def grow(self, capacity):
+        """Reallocates the arrays for at least capacity vehicles."""
+        capacity = max(capacity, 2 * len(self.battery_level))
+        for name, fill in (("battery_level", 0), ("battery_level_is_int", False), ("last_update_time", np.nan), ("status", 0), ("parking_spot", -1), ("task", 0)):
+            array = getattr(self, name)
+            grown = np.full(capacity, fill, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            setattr(self, name, grown)
+
+    def add_vehicles(self, battery_levels, parking_spot_ids):
+        """
+        Adds vehicles with the status "ready" and no task.
+
+        Args:
+            battery_levels (array-like): Initial battery levels.
+            parking_spot_ids (array-like): Ids of the parking spots the vehicles start at.
+
+        Returns:
+            range: The rows of the new vehicles.
+        """
+        is_int = [isinstance(level, int) for level in battery_levels]
+        battery_levels = np.asarray(battery_levels, dtype=np.float64)
+        start, end = self.size, self.size + len(battery_levels)
+        if end > len(self.battery_level):
+            self.grow(end)
+        self.battery_level[start:end] = battery_levels
+        self.battery_level_is_int[start:end] = is_int
+        self.last_update_time[start:end] = np.nan
+        self.status[start:end] = self.STATUS_CODES["ready"]
+        self.parking_spot[start:end] = -1
+        self.task[start:end] = self.NO_TASK
+        self.size = end
+
+        self.battery_sum += float(battery_levels.sum())
+        for index, parking_spot_id in zip(range(start, end), np.asarray(parking_spot_ids).tolist()):
+            self.set_parking_spot(index, parking_spot_id)
+        return range(start, end)
+
+    def add_vehicle(self, battery_level, parking_spot_id):
+        """Adds one vehicle, returns its row."""
+        return self.add_vehicles([battery_level], [parking_spot_id])[0]
+
+    def set_battery_level(self, index, level):
+        self.battery_sum += level - self.battery_level.item(index)
+        self.battery_level[index] = level
+        self.battery_level_is_int[index] = isinstance(level, int)
+
+    def set_task(self, index, flag):
+        """Sets the task flag (NO_TASK, TASK or BOUNTY_TASK) of a vehicle."""
+        self.bounty_count += (flag == self.BOUNTY_TASK) - (self.task.item(index) == self.BOUNTY_TASK)
+        self.task[index] = flag
+
+    def set_parking_spot(self, index, parking_spot_id):
+        """Moves a vehicle to a parking spot, -1 for none."""
+        old_parking_spot_id = self.parking_spot.item(index)
+        if old_parking_spot_id == parking_spot_id:
+            return
+        if old_parking_spot_id >= 0:
+            self.move_count(old_parking_spot_id, -1)
+        if parking_spot_id >= 0:
+            self.move_count(parking_spot_id, 1)
+        self.parking_spot[index] = parking_spot_id
+
+    def move_count(self, parking_spot_id, change):
+        if parking_spot_id >= len(self.spot_counts):
+            self.spot_counts.extend([0] * (parking_spot_id + 1 - len(self.spot_counts)))
+        count = self.spot_counts[parking_spot_id]
+        new_count = count + change
+        self.spot_counts[parking_spot_id] = new_count
+        if new_count >= len(self.count_histogram):
+            self.count_histogram.append(0)
+        if count > 0:
+            self.count_histogram[count] -= 1
+        if new_count > 0:
+            self.count_histogram[new_count] += 1
+
+    def avg_battery_level(self):
+        if self.size == 0:
+            return 0
+        return self.battery_sum / self.size
+
+    def num_bounties(self):
+        """Number of vehicles with a bounty task."""
+        return self.bounty_count
+
+    def vehicle_distribution_gini(self, num_parking_spots):
+        """Gini coefficient of the number of vehicles per parking spot, from the count histogram.
+
+        The cumulative sums of the sorted counts are summed block by block: the h parking spots with c vehicles
+        add h * (cumulative before the block) + c * h * (h + 1) / 2. The integers are exact, so the result is the
+        same as with the sorted list of counts. The empty parking spots come first and add nothing."""
+        cumulative = 0
+        sum_of_cumulative = 0
+        for count, num_spots in enumerate(self.count_histogram):
+            if num_spots:
+                sum_of_cumulative += num_spots * cumulative + count * num_spots * (num_spots + 1) // 2
+                cumulative += count * num_spots
+        gini_numerator = sum_of_cumulative - (cumulative / 2.0)
+        gini_denominator = self.size * num_parking_spots / 2.0
+        return (gini_denominator - gini_numerator) / gini_denominator
+
+
+if __name__ == "__main__":
+    # Benchmark of the snapshot metrics for a large fleet, against loops over vehicle objects and array scans
+    import random
+    import time
+
+    class VehicleObject:
+        def __init__(self, level, parking_spot_id):
+            self.level = level
+            self.parking_spot_id = parking_spot_id
+
+    random.seed(0)
+    num_vehicles, num_parking_spots = 100000, 20000
+    levels = [random.random() for _ in range(num_vehicles)]
+    spot_ids = [random.randrange(num_parking_spots) for _ in range(num_vehicles)]
+    fleet_state = FleetState(num_vehicles)
+    fleet_state.add_vehicles(levels, spot_ids)
+    vehicles = [VehicleObject(level, spot_id) for level, spot_id in zip(levels, spot_ids)]
+
+    start = time.perf_counter()
+    avg_battery_level = sum([vehicle.level for vehicle in vehicles]) / num_vehicles
+    vehicles_per_spot = [0] * num_parking_spots
+    for vehicle in vehicles:
+        vehicles_per_spot[vehicle.parking_spot_id] += 1
+    cumulative_vehicles = np.cumsum(sorted(vehicles_per_spot))
+    gini_denominator = num_vehicles * num_parking_spots / 2.0
+    gini = (gini_denominator - (cumulative_vehicles.sum() - cumulative_vehicles[-1] / 2.0)) / gini_denominator
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cumulative_vehicles = np.cumsum(np.sort(np.bincount(fleet_state.parking_spot[:num_vehicles], minlength=num_parking_spots)))
+    array_avg_battery_level = fleet_state.battery_level[:num_vehicles].sum() / num_vehicles
+    array_gini = (gini_denominator - (cumulative_vehicles.sum() - cumulative_vehicles[-1] / 2.0)) / gini_denominator
+    array_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fleet_avg_battery_level = fleet_state.avg_battery_level()
+    fleet_gini = fleet_state.vehicle_distribution_gini(num_parking_spots)
+    online_time = time.perf_counter() - start
+
+    # move vehicles around and check that the accumulators follow
+    for index in random.sample(range(num_vehicles), 10000):
+        fleet_state.set_parking_spot(index, random.randrange(num_parking_spots))
+        fleet_state.set_battery_level(index, random.random())
+    cumulative_vehicles = np.cumsum(np.sort(np.bincount(fleet_state.parking_spot[:num_vehicles], minlength=num_parking_spots)))
+    moved_gini = (gini_denominator - (cumulative_vehicles.sum() - cumulative_vehicles[-1] / 2.0)) / gini_denominator
+
+    assert abs(fleet_avg_battery_level - avg_battery_level) < 1e-9 and fleet_gini == gini == array_gini
+    assert abs(fleet_state.avg_battery_level() - fleet_state.battery_level.mean()) < 1e-9
+    assert fleet_state.vehicle_distribution_gini(num_parking_spots) == moved_gini
+    print("%d vehicles: object loops %.2f ms, arrays %.2f ms, online accumulators %.3f ms"
+          % (num_vehicles, loop_time * 1e3, array_time * 1e3, online_time * 1e3))
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import shutil
+
+import networkx as nx
+import numpy as np
+
+
+class GraphStore:
+    """
+    On-disk cache for the street graphs used by the Map class.
+
+    Each graph is keyed by a hash of the area GeoJSON and the network type ('drive' or 'bike') and stored
+    as a directory of .npy arrays: node ids and coordinates, and the edges as node indices plus length.
+    Only the attributes the simulation uses are kept. Arrays are memory mapped when loaded, so opening a
+    cached graph is fast and does not need any network access.
+    """
+    version = 1
+    array_names = ["node_ids", "node_x", "node_y", "edge_u", "edge_v", "edge_length"]
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def get_key(area_dict, network_type):
+        """Returns the cache key for an area (parsed GeoJSON) and network type."""
+        # hash the normalized json so formatting of the file does not matter
+        area = json.dumps(area_dict, sort_keys=True, separators=(",", ":"))
+        digest = hashlib.sha256(area.encode("utf-8")).hexdigest()[:16]
+        return f"{network_type}_{digest}"
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def contains(self, key):
+        return os.path.isfile(os.path.join(self.get_path(key), "meta.json"))
+
+    def save(self, key, graph):
+        """
+        Serialize a graph to the store.
+
+        Args:
+            key (str): The cache key, see get_key.
+            graph (networkx.MultiDiGraph): An osmnx graph with 'x', 'y' node and 'length' edge attributes.
+        """
+        arrays = self.graph_to_arrays(graph)
+        path = self.get_path(key)
+        # write to a temporary directory first so a crash never leaves a half written graph behind
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in self.array_names:
+            np.save(os.path.join(tmp_path, name + ".npy"), arrays[name])
+        meta = {
+            "version": self.version,
+            "crs": str(graph.graph.get("crs", "epsg:4326")),
+            "num_nodes": len(arrays["node_ids"]),
+            "num_edges": len(arrays["edge_u"]),
+        }
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    def load(self, key):
+        """
+        Load the arrays of a cached graph, memory mapped.
+
+        Returns:
+            dict: The arrays (see array_names) and the 'crs' of the graph.
+        """
+        path = self.get_path(key)
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["version"] != self.version:
+            raise ValueError(f"Graph cache {path} has version {meta['version']}, expected {self.version}")
+        arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in self.array_names}
+        arrays["crs"] = meta["crs"]
+        return arrays
+
+    @staticmethod
+    def graph_to_arrays(graph):
+        """Converts a networkx graph to the arrays stored in the cache."""
+        node_ids = np.fromiter(graph.nodes, dtype=np.int64, count=graph.number_of_nodes())
+        node_index = {node: i for i, node in enumerate(node_ids.tolist())}
+        node_x = np.array([graph.nodes[node]["x"] for node in graph.nodes], dtype=np.float64)
+        node_y = np.array([graph.nodes[node]["y"] for node in graph.nodes], dtype=np.float64)
+
+        num_edges = graph.number_of_edges()
+        edge_u = np.empty(num_edges, dtype=np.int32)
+        edge_v = np.empty(num_edges, dtype=np.int32)
+        edge_length = np.empty(num_edges, dtype=np.float64)
+        for i, (u, v, length) in enumerate(graph.edges(data="length")):
+            edge_u[i] = node_index[u]
+            edge_v[i] = node_index[v]
+            edge_length[i] = length
+        return {
+            "node_ids": node_ids,
+            "node_x": node_x,
+            "node_y": node_y,
+            "edge_u": edge_u,
+            "edge_v": edge_v,
+            "edge_length": edge_length,
+            "crs": str(graph.graph.get("crs", "epsg:4326")),
+        }
+
+    @staticmethod
+    def arrays_to_graph(arrays):
+        """Rebuilds a networkx graph, usable by osmnx routing, from cached arrays."""
+        graph = nx.MultiDiGraph(crs=arrays["crs"])
+        node_ids = arrays["node_ids"].tolist()
+        graph.add_nodes_from(
+            (node, {"x": x, "y": y}) for node, x, y in zip(node_ids, arrays["node_x"].tolist(), arrays["node_y"].tolist())
+        )
+        graph.add_edges_from(
+            (node_ids[u], node_ids[v], {"length": length})
+            for u, v, length in zip(arrays["edge_u"].tolist(), arrays["edge_v"].tolist(), arrays["edge_length"].tolist())
+        )
+        return graph
@@ -4,6 +4,7 @@ class Location:
         self.lat = lat
         self.drive_node = None
         self.ride_node = None
+        self.parking_spot_id = None  # set when the location belongs to a parking spot
         if map is not None: 
             self.drive_node = map.get_node_from_location("drive", self)
             self.ride_node = map.get_node_from_location("bike", self)
@@ -1,37 +1,156 @@
 import osmnx as ox
+import networkx as nx
 import matplotlib.pyplot as plt
 import json
 from shapely.geometry import shape
-from geopy.distance import geodesic, distance
-from functools import lru_cache
 from scipy.spatial import KDTree
 import numpy as np
 import pandas as pd
 from pyproj import Proj
 
+from CSRRouter import CSRRouter
+import Distance
+from GraphStore import GraphStore
 from Location import Location
 from ParkingSpotclass import ParkingSpot
+from RoutingCache import RoutingCache
 
 class Map:
     """
     This class is used to calculate distances between locations.
     It uses the osmnx library to calculate distances.
     """
-    def __init__(self, area_ploygon_path):
+    def __init__(self, area_ploygon_path, graph_cache_dir=None, cache_only=False, routing_backend="csr",
+                 routing_cache_size=16384, routing_cache_policy="lru", routing_cache_path=None,
+                 distance_matrix_max_nodes=4096):
+        """
+        Args:
+            area_ploygon_path (str): Path to the geojson of the operational area.
+            graph_cache_dir (str): Directory of the on-disk graph cache (see GraphStore). Graphs found in the
+                                   cache are loaded lazily, missing graphs are downloaded and added to it.
+            cache_only (bool): Never download, raise instead if a graph is missing in the cache.
+            routing_backend (str): "csr" for the compiled CSRRouter, "osmnx" for osmnx/networkx shortest paths
+                                   (slow, kept for validation).
+            routing_cache_size (int): Maximum number of cached route lengths, None for unbounded.
+            routing_cache_policy (str): Eviction policy of the routing cache, "lru" or "fifo".
+            routing_cache_path (str): Optional .npz file to persist the routing cache between runs.
+            distance_matrix_max_nodes (int): Largest number of unique parking spot nodes of a graph for which the
+                                             dense distance matrix is precomputed (4096: 128 MiB per graph in
+                                             float64), None for no limit. See build_distance_matrices.
+        """
+        if routing_backend not in ("csr", "osmnx"):
+            raise ValueError(f"Unknown routing backend: {routing_backend}")
+        self.routing_backend = routing_backend
+        self.routers = {}        # CSRRouter per network type, built on first use
+        self.routing_cache = RoutingCache(routing_cache_size, routing_cache_policy, routing_cache_path)
         # init graphs, get geojson from file, 
         with open(area_ploygon_path, "r") as file:
             area = file.read()
         area_dict = json.loads(area)
-        polygon = shape(area_dict)
-        # download graph from polygon
-        self.graph_drive = ox.graph_from_polygon(polygon, network_type='drive')
-        self.graph_bike = ox.graph_from_polygon(polygon, network_type='bike')
+        self.polygon = shape(area_dict)
+
+        self.graph_store = GraphStore(graph_cache_dir) if graph_cache_dir is not None else None
+        self.graph_keys = {network_type: GraphStore.get_key(area_dict, network_type) for network_type in ("drive", "bike")}
+        self.graphs = {}         # networkx graphs, built on first access
+        self.graph_arrays = {}   # cached graph arrays, memory mapped
+
+        for network_type, key in self.graph_keys.items():
+            if self.graph_store is not None and self.graph_store.contains(key):
+                continue
+            if cache_only:
+                raise FileNotFoundError(f"No cached '{network_type}' graph for {area_ploygon_path} in {graph_cache_dir} (cache only mode)")
+            # download graph from polygon
+            self.graphs[network_type] = ox.graph_from_polygon(self.polygon, network_type=network_type)
+            if self.graph_store is not None:
+                self.graph_store.save(key, self.graphs[network_type])
         
         # Handling parking spots
         self.parking_spots = None
         self.kdtree = None
         self.proj = None  # Projection is not initialized until create_kdtree is called
 
+        # KD-trees over the graph nodes in UTM coordinates, built on first use, see get_node_kdtree
+        self.node_kdtrees = {}
+        self.node_proj = self.get_utm_proj_from_lon(self.polygon.centroid.x)
+
+        # Precomputed parking spot to parking spot distances, see build_distance_matrices
+        self.distance_matrices = {}
+        self.distance_matrix_max_nodes = distance_matrix_max_nodes
+        # Parking spots within walking distance of each parking spot as CSR arrays, see build_neighbor_graph
+        self.neighbor_graph = None
+
+    @property
+    def graph_drive(self):
+        return self.get_graph("drive")
+
+    @property
+    def graph_bike(self):
+        return self.get_graph("bike")
+
+    def get_graph(self, network_type):
+        """Returns the networkx graph of a network type, building it from the graph cache on first access."""
+        if network_type not in self.graphs:
+            self.graphs[network_type] = GraphStore.arrays_to_graph(self.get_graph_arrays(network_type))
+        return self.graphs[network_type]
+
+    def get_graph_arrays(self, network_type):
+        """Returns the array representation (see GraphStore) of a graph, loaded lazily from the graph cache."""
+        if network_type not in self.graph_arrays:
+            if self.graph_store is not None and self.graph_store.contains(self.graph_keys[network_type]):
+                self.graph_arrays[network_type] = self.graph_store.load(self.graph_keys[network_type])
+            else:
+                self.graph_arrays[network_type] = GraphStore.graph_to_arrays(self.graphs[network_type])
+        return self.graph_arrays[network_type]
+
+    def get_router(self, network_type):
+        """Returns the CSRRouter of a network type, converting the graph on first use."""
+        if network_type not in self.routers:
+            self.routers[network_type] = CSRRouter(self.get_graph_arrays(network_type))
+        return self.routers[network_type]
+
+    def get_node_kdtree(self, network_type):
+        """Returns the KD-tree over the (UTM projected) nodes of a graph, building it on first use."""
+        if network_type not in self.node_kdtrees:
+            arrays = self.get_graph_arrays(network_type)
+            node_x, node_y = self.node_proj(np.asarray(arrays["node_x"]), np.asarray(arrays["node_y"]))
+            self.node_kdtrees[network_type] = KDTree(np.column_stack((node_x, node_y)))
+        return self.node_kdtrees[network_type]
+
+    def snap_points(self, network_type, lons, lats):
+        """
+        Finds the nearest graph node for many points in one vectorized query.
+
+        Args:
+            network_type (str): "drive" or "bike".
+            lons (array-like): Longitudes of the points.
+            lats (array-like): Latitudes of the points.
+
+        Returns:
+            numpy.ndarray: The node ids, in the order of the points.
+        """
+        x, y = self.node_proj(np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+        _, indices = self.get_node_kdtree(network_type).query(np.column_stack((x, y)))
+        return np.asarray(self.get_graph_arrays(network_type)["node_ids"])[indices]
+
+    def snap_locations(self, locations, graph):
+        """
+        Snaps many locations to their nearest node and stores it on the locations (drive_node or ride_node).
+
+        Args:
+            locations (list of Location): The locations to snap.
+            graph (str): "drive" or "bike".
+
+        Returns:
+            numpy.ndarray: The node ids, in the order of the locations.
+        """
+        lons = np.fromiter((location.lon for location in locations), dtype=np.float64, count=len(locations))
+        lats = np.fromiter((location.lat for location in locations), dtype=np.float64, count=len(locations))
+        nodes = self.snap_points(graph, lons, lats)
+        attribute = "drive_node" if graph == "drive" else "ride_node"
+        for location, node in zip(locations, nodes.tolist()):
+            setattr(location, attribute, node)
+        return nodes
+
     def create_kdtree(self, parking_spots):
         """
         Create a KDTree for parking spots using UTM coordinates, initializing the projection based on the first parking spot.
@@ -46,9 +165,9 @@ class Map:
         first_lon = parking_spots[0].location.lon
         self.proj = self.get_utm_proj_from_lon(first_lon)
 
-        # Convert parking spots to UTM coordinates using the newly set projection
-        utm_locations = [self.latlon_to_utm(ps.location.lat, ps.location.lon) for ps in parking_spots]
-        self.kdtree = KDTree(utm_locations)
+        # Convert parking spots to UTM coordinates using the newly set projection, in one array call
+        lons, lats = Distance.location_coordinates([ps.location for ps in parking_spots])
+        self.kdtree = KDTree(np.column_stack(self.proj(lons, lats)))
 
     def latlon_to_utm(self, lat, lon):
         """Convert latitude and longitude to UTM coordinates."""
@@ -86,31 +205,212 @@ class Map:
         indices = self.kdtree.query_ball_point(utm_position, walk_radius)
         return indices
 
+    def build_neighbor_graph(self, walk_radius):
+        """
+        Finds the parking spots within walk_radius of every parking spot with one batched query of the KD-tree.
+
+        The result is stored as CSR arrays (indptr, indices, distances): the neighbors of parking spot i are
+        indices[indptr[i]:indptr[i + 1]], sorted by walking (straight line) distance, without the spot itself.
+        The arrays belong to the map, so they are shared by all runs that use the same map and parking spots.
+
+        Args:
+            walk_radius (float): The walking distance in meters.
+        """
+        pairs = self.kdtree.sparse_distance_matrix(self.kdtree, walk_radius, output_type="ndarray")
+        pairs = pairs[pairs["i"] != pairs["j"]]
+        # sort by parking spot, then distance, then neighbor index
+        pairs = pairs[np.lexsort((pairs["j"], pairs["v"], pairs["i"]))]
+        indptr = np.zeros(self.kdtree.n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pairs["i"], minlength=self.kdtree.n), out=indptr[1:])
+        self.neighbor_graph = (indptr, pairs["j"].astype(np.int32), pairs["v"].astype(np.float32))
+
+    def get_neighbor_indices(self, parking_spot_id):
+        """Returns the indices of the parking spots within walking distance of a parking spot, nearest first."""
+        if self.neighbor_graph is None:
+            return np.empty(0, dtype=np.int32)
+        indptr, indices, _ = self.neighbor_graph
+        return indices[indptr[parking_spot_id]:indptr[parking_spot_id + 1]]
+
     def find_nearest_parking_spot(self, location):
         location_utm = self.latlon_to_utm(location.lat, location.lon)
         _, index_list = self.kdtree.query([location_utm])  # Use underscore to ignore the distance
         return index_list[0]
 
+    def find_nearest_parking_spots(self, lons, lats):
+        """
+        Finds the nearest parking spot for many points with one projection call and one KD-tree query.
+
+        Args:
+            lons (array-like): Longitudes of the points.
+            lats (array-like): Latitudes of the points.
+
+        Returns:
+            numpy.ndarray: The parking spot indices, in the order of the points.
+        """
+        if not self.proj:
+            raise Exception("Projection not initialized. Please call create_kdtree first.")
+        x, y = self.proj(np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+        _, indices = self.kdtree.query(np.column_stack((x, y)))
+        return indices
+
+    def build_distance_matrices(self, parking_spots, dtype=np.float64):
+        """
+        Precompute the bike and drive distances between all parking spots.
+
+        One Dijkstra search is run from every unique snapped node (ride_node for bike, drive_node for drive)
+        and the distances to all other parking spot nodes are stored in a dense matrix. Parking spots snapped
+        to the same node share a row, so the matrix is at most len(parking_spots) squared.
+
+        A graph with more unique parking spot nodes than distance_matrix_max_nodes gets no matrix, since its size
+        grows with the square of the nodes. Its distances are then routed live on demand (get_bike_ride_distance,
+        get_drive_distance) and kept in the routing cache.
+
+        Args:
+            parking_spots (list of ParkingSpot): The parking spots, ParkingSpot.id must be the index in the list.
+            dtype (numpy.dtype): Data type of the stored distances. float64 gives the same distances as live
+                                 routing, a smaller type saves memory but rounds them.
+        """
+        for graph_type in ("bike", "drive"):
+            distance_matrix = self.build_distance_matrix(graph_type, parking_spots, dtype)
+            if distance_matrix is None:
+                print(f"{graph_type} distances are routed on demand: more than {self.distance_matrix_max_nodes} parking spot nodes")
+                self.distance_matrices.pop(graph_type, None)
+            else:
+                self.distance_matrices[graph_type] = distance_matrix
+
+    def build_distance_matrix(self, graph_type, parking_spots, dtype=np.float64):
+        """
+        Precompute the shortest path lengths between the parking spots in one graph.
+
+        Args:
+            graph_type (str): "bike" or "drive".
+            parking_spots (list of ParkingSpot): The parking spots, ParkingSpot.id must be the index in the list.
+            dtype (numpy.dtype): Data type of the stored distances.
+
+        Returns:
+            tuple: (spot_rows, matrix) where spot_rows maps ParkingSpot.id to a row/column of matrix.
+                   Unreachable pairs are stored as inf. None if there are more than distance_matrix_max_nodes
+                   unique parking spot nodes.
+        """
+        spot_nodes = [self.get_node_from_location(graph_type, ps.location) for ps in parking_spots]
+        nodes, spot_rows = np.unique(spot_nodes, return_inverse=True)
+        if self.distance_matrix_max_nodes is not None and len(nodes) > self.distance_matrix_max_nodes:
+            return None
+
+        if self.routing_backend == "csr":
+            matrix = self.get_router(graph_type).distance_matrix(nodes, nodes, dtype)
+        else:
+            graph = self.graph_bike if graph_type == "bike" else self.graph_drive
+            node_rows = {node: row for row, node in enumerate(nodes.tolist())}
+            matrix = np.full((len(nodes), len(nodes)), np.inf, dtype=dtype)
+            for row, node in enumerate(nodes.tolist()):
+                lengths = nx.single_source_dijkstra_path_length(graph, node, weight="length")
+                for target, length in lengths.items():
+                    column = node_rows.get(target)
+                    if column is not None:
+                        matrix[row, column] = length
+        return spot_rows.astype(np.int32), matrix
+
+    def lookup_distance(self, graph_type, origin_location, destination_location):
+        """
+        Look up a precomputed distance between two parking spot locations.
+
+        Returns:
+            float or None: The distance in meters, or None if one of the locations is not a parking spot
+                           covered by the distance matrix (the caller should then route live).
+        """
+        if graph_type not in self.distance_matrices:
+            return None
+        origin_id = origin_location.parking_spot_id
+        destination_id = destination_location.parking_spot_id
+        spot_rows, matrix = self.distance_matrices[graph_type]
+        if origin_id is None or destination_id is None or max(origin_id, destination_id) >= len(spot_rows):
+            return None
+        distance = float(matrix[spot_rows[origin_id], spot_rows[destination_id]])
+        if distance == np.inf:
+            # same fallback as when no route is found in live routing
+            detour_factor = 1.2 if graph_type == "bike" else 1.4
+            return self.calculate_distance(origin_location, destination_location) * detour_factor
+        return distance
+
     def calculate_distance(self, origin, destination):
         """ Calculates distances to destination
-        Method used: Geographic Euclidian distance"""
-        return geodesic((origin.lat, origin.lon), (destination.lat, destination.lon)).meters
-         
+        Method used: Euclidean distance in the UTM projection (see Distance.projected)"""
+        return float(self.calculate_distances(origin, [destination])[0])
+
+    def calculate_distances(self, origin, destinations):
+        """
+        Straight line distances from one location to many locations in one vectorized call.
+
+        Uses the projection of create_kdtree, or the projection of the area before the parking spots are loaded.
+        Within the UTM zone the error against the geodesic distance is below 0.1%.
+
+        Args:
+            origin (Location): The origin.
+            destinations (list of Location): The destinations.
+
+        Returns:
+            numpy.ndarray: The distances in meters, in the order of destinations.
+        """
+        lons, lats = Distance.location_coordinates(destinations)
+        proj = self.proj if self.proj is not None else self.node_proj
+        return Distance.projected(proj, origin.lon, origin.lat, lons, lats)
+
 
-    @lru_cache(maxsize=4096*2*2)  # Adjust maxsize as needed
     def get_bike_ride_distance(self, origin_location, destination_location):
+        # O(1) lookup for parking spot to parking spot rides, live routing otherwise
+        distance = self.lookup_distance("bike", origin_location, destination_location)
+        if distance is None:
+            distance = self.route_bike_distance(origin_location, destination_location)
+        return distance
+
+    def route_bike_distance(self, origin_location, destination_location):
         # get nodes
         origin_node = self.get_node_from_location("bike", origin_location)
         destination_node = self.get_node_from_location("bike", destination_location)
+        # get route length
+        route_length = self.get_shortest_path_length("bike", origin_node, destination_node)
+        if route_length == np.inf:
+            return self.calculate_distance(origin_location, destination_location) * 1.2
+        return route_length
+
+    def get_shortest_path_length(self, network_type, origin_node, destination_node):
+        """
+        Returns the shortest path length between two nodes, inf if there is no route.
+        Lengths are cached in routing_cache, keyed by (graph, origin_node, destination_node).
+        """
+        key = (self.graph_keys[network_type], origin_node, destination_node)
+        route_length = self.routing_cache.get(key)
+        if route_length is None:
+            if self.routing_backend == "csr":
+                route_length = self.get_router(network_type).distance(origin_node, destination_node)
+            else:
+                route_length = self.get_osmnx_route_length(network_type, origin_node, destination_node)
+            self.routing_cache.put(key, route_length)
+        return route_length
+
+    def get_osmnx_route_length(self, network_type, origin_node, destination_node):
+        """Routes with osmnx and sums the edge lengths of the route, inf if there is no route."""
+        graph = self.get_graph(network_type)
+        # Check if nodes are in the graph
+        if origin_node not in graph or destination_node not in graph:
+            raise Exception(f"One of the nodes is not in the graph: Origin {origin_node}, Destination {destination_node}")
+
         # get route
-        route = ox.routing.shortest_path(self.graph_bike, origin_node, destination_node, weight='length')
+        try:
+            route = ox.routing.shortest_path(graph, origin_node, destination_node, weight='length')
+        except Exception as e:
+            raise Exception(f"Failed to find route: {e}")
 
         if route is None:
-            return self.calculate_distance(origin_location, destination_location) * 1.2
+            return np.inf
         # get route length
-        route_length = self.get_route_length(route, "bike")
-        return route_length
-    
+        try:
+            return float(self.get_route_length(route, network_type))
+        except Exception as e:
+            print("origin: ", origin_node, "destination: ", destination_node)
+            raise Exception(f"Failed to calculate route length: {e}")
+
     def get_route_length(self, route, route_type=None):
         # Convert the route to a GeoDataFrame
         # if route is empty, return 0
@@ -141,32 +441,68 @@ class Map:
 
     #     return total_length
     
-    @lru_cache(maxsize=4096*2*2)  # Adjust maxsize as needed
     def get_drive_distance(self, origin_location, destination_location):
+        # O(1) lookup for parking spot to parking spot drives, live routing otherwise
+        distance = self.lookup_distance("drive", origin_location, destination_location)
+        if distance is None:
+            distance = self.route_drive_distance(origin_location, destination_location)
+        return distance
+
+    def get_drive_distances(self, origin_location, destination_locations, radius=None):
+        """
+        Drive distances from one location to many locations with a single search.
+
+        Parking spot to parking spot distances are gathered from the precomputed matrix, otherwise one Dijkstra
+        search is run from the origin node instead of one search per destination.
+
+        Args:
+            origin_location (Location): The start of all drives.
+            destination_locations (list of Location): The destinations.
+            radius (float): Optional cap in meters on the search. Destinations further away get inf.
+                            Without a cap unreachable destinations get the same fallback as get_drive_distance.
+
+        Returns:
+            numpy.ndarray: The distances in meters, in the order of destination_locations.
+        """
+        if len(destination_locations) == 0:
+            return np.empty(0)
+        limit = np.inf if radius is None else radius
+
+        destination_ids = [location.parking_spot_id for location in destination_locations]
+        if "drive" in self.distance_matrices and origin_location.parking_spot_id is not None and None not in destination_ids:
+            spot_rows, matrix = self.distance_matrices["drive"]
+            if max(destination_ids) < len(spot_rows) and origin_location.parking_spot_id < len(spot_rows):
+                distances = matrix[spot_rows[origin_location.parking_spot_id], spot_rows[destination_ids]].astype(np.float64)
+                distances[distances > limit] = np.inf
+                return self.fill_unreachable(distances, origin_location, destination_locations, radius, 1.4)
+
+        if self.routing_backend != "csr":
+            distances = np.array([self.get_drive_distance(origin_location, location) for location in destination_locations])
+            distances[distances > limit] = np.inf
+            return distances
+
+        origin_node = self.get_node_from_location("drive", origin_location)
+        destination_nodes = [self.get_node_from_location("drive", location) for location in destination_locations]
+        distances = self.get_router("drive").distances(origin_node, destination_nodes, limit)
+        return self.fill_unreachable(distances, origin_location, destination_locations, radius, 1.4)
+
+    def fill_unreachable(self, distances, origin_location, destination_locations, radius, detour_factor):
+        """Replaces inf by the geographic distance times detour_factor, unless inf may mean 'outside the radius'."""
+        if radius is None:
+            unreachable = np.flatnonzero(distances == np.inf)
+            if len(unreachable):
+                locations = [destination_locations[i] for i in unreachable]
+                distances[unreachable] = self.calculate_distances(origin_location, locations) * detour_factor
+        return distances
+
+    def route_drive_distance(self, origin_location, destination_location):
         # get nodes
         origin_node = self.get_node_from_location("drive", origin_location)
         destination_node = self.get_node_from_location("drive", destination_location)
-        
-        # Check if nodes are in the graph
-        if origin_node not in self.graph_drive or destination_node not in self.graph_drive:
-            raise Exception(f"One of the nodes is not in the graph: Origin {origin_node}, Destination {destination_node}")
-
-        # get route
-        try:
-            route = ox.routing.shortest_path(self.graph_drive, origin_node, destination_node, weight='length')
-        except Exception as e:
-            raise Exception(f"Failed to find route: {e}")
-        
-        if route is None:
-            return self.calculate_distance(origin_location, destination_location) * 1.4
         # get route length
-        try:
-            route_length = self.get_route_length(route)
-        except Exception as e:
-            print("origin location: ", origin_location,"destination location: ", destination_location)
-            print("origin: ", origin_node, "destination: ", destination_node)
-            raise Exception(f"Failed to calculate route length: {e}")
-
+        route_length = self.get_shortest_path_length("drive", origin_node, destination_node)
+        if route_length == np.inf:
+            return self.calculate_distance(origin_location, destination_location) * 1.4
         return route_length
 
     def get_node_from_location(self, graph, location):
@@ -174,7 +510,7 @@ class Map:
         Retrieve the nearest node in the specified graph for a given location.
 
         Args:
-        graph (networkx.Graph): The graph from which to find the nearest node.
+        graph (str): The graph ("drive" or "bike") in which to find the nearest node.
         location (Location): The location object containing longitude and latitude.
 
         Returns:
@@ -183,11 +519,10 @@ class Map:
         if graph == "drive":
             if location.drive_node is not None:
                 return location.drive_node
-            return ox.distance.nearest_nodes(self.graph_drive, location.lon, location.lat)
         elif graph == "bike":
             if location.ride_node is not None:
                 return location.ride_node
-            return ox.distance.nearest_nodes(self.graph_bike, location.lon, location.lat)
+        return self.snap_points(graph, [location.lon], [location.lat])[0].item()
     
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 import math
+from heapq import heapify, heappop, heappush
 
 class ParkingSpot:
     id_count = -1
@@ -6,8 +7,16 @@ class ParkingSpot:
         self.next_id()
         self.id = ParkingSpot.id_count
         self.location = location
-        self.vehicles = []  # list to store vehicles parked at this spot
-        self.neighbor_parking_spots = []
+        self.location.parking_spot_id = self.id
+        self.vehicles = {}  # vehicles parked at this spot -> parking number, the order they were parked in
+        self.num_parked = 0
+        # the available vehicles parked at this spot -> parking number, kept in sync by update_availability
+        self.available_vehicles = {}
+        # heap of (parking number, push number, vehicle) over the available vehicles, entries of vehicles that are
+        # no longer available are dropped lazily when they reach the top, see pick_available_vehicle. The push
+        # number breaks ties between entries of the same vehicle, so vehicles are never compared.
+        self.available_heap = []
+        self.num_pushed = 0
         self.num_vehicles_cap = math.inf  # Maximum number of vehicles
     
     @classmethod
@@ -22,15 +31,44 @@ class ParkingSpot:
         return f"Parkingspot-id: {self.id:<5} Location : {self.location} "
 
     def add_vehicle(self, vehicle):
-        self.vehicles.append(vehicle)
+        self.vehicles[vehicle] = self.num_parked
+        self.num_parked += 1
+        self.update_availability(vehicle)
 
     def remove_vehicle(self, vehicle):
-        self.vehicles.remove(vehicle)
+        del self.vehicles[vehicle]
+        self.available_vehicles.pop(vehicle, None)
+
+    def update_availability(self, vehicle):
+        """Adds or removes a parked vehicle from available_vehicles after vehicle.available has changed.
+        O(log n) when it becomes available, O(1) otherwise."""
+        if vehicle.available and vehicle in self.vehicles:
+            if vehicle not in self.available_vehicles:
+                parking_number = self.vehicles[vehicle]
+                self.available_vehicles[vehicle] = parking_number
+                heappush(self.available_heap, (parking_number, self.num_pushed, vehicle))
+                self.num_pushed += 1
+                if len(self.available_heap) > 2 * len(self.available_vehicles) + 16:
+                    self.compact_available_heap()
+        else:
+            self.available_vehicles.pop(vehicle, None)
+
+    def compact_available_heap(self):
+        """Rebuilds the heap without the entries of vehicles that are no longer available."""
+        self.available_heap = [(parking_number, index, vehicle)
+                               for index, (vehicle, parking_number) in enumerate(self.available_vehicles.items())]
+        heapify(self.available_heap)
+
+    def has_available_vehicle(self):
+        return bool(self.available_vehicles)
 
     def pick_available_vehicle(self):
-        """Tries to pick a vehicle at the parkingspot. Returns vehicle if possible, else None."""
-        for vehicle in self.vehicles:
-            if vehicle.available:
+        """Tries to pick a vehicle at the parkingspot. Returns vehicle if possible, else None.
+        The available vehicle that was parked first is picked."""
+        heap = self.available_heap
+        while heap:
+            parking_number, _, vehicle = heap[0]
+            if self.available_vehicles.get(vehicle) == parking_number:
                 return vehicle
+            heappop(heap)  # no longer available, or parked again since
         return None
-
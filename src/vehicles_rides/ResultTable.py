@@ -0,0 +1,133 @@
+def format_value(value, digits=2):
+    """
+    Formats a value for the result csv files.
+
+    bools are written as 0/1 and ints as they are. floats are rounded to digits, or truncated to an int if digits is
+    0. Anything else (strings, None) is written with str.
+    """
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if digits == 0:
+            return str(int(value))
+        return str(round(value, digits))
+    return str(value)
+
+
+class ResultTable:
+    """
+    Buffered, column wise writer of one result csv file.
+
+    Records are appended with raw values into one list per column, nothing is formatted on append. When the buffer
+    holds buffer_size records (and on flush/close) every column is formatted in one pass and the rows are written in
+    one block. The columns are Python lists rather than typed arrays, since the text depends on the Python type of
+    each value (e.g. an int 5 is written "5" but a float 5.0 "5.0" in a column with 2 digits).
+    """
+    missing = ""  # value of columns missing in a record
+
+    def __init__(self, path, header, digits=None, buffer_size=65536, writer=None):
+        """
+        Args:
+            path (str): The csv file, the header is written when it is opened.
+            header (list): The column names, in file order.
+            digits (dict): Rounding digits per column name (see format_value), 2 for columns not in it.
+            buffer_size (int): Number of records buffered before they are written.
+            writer (ResultWriter): Optional background writer, the full buffers are written by its thread.
+        """
+        self.header = header
+        self.names = set(header)
+        self.writer = writer
+        digits = {} if digits is None else digits
+        self.digits = [digits.get(name, 2) for name in header]
+        self.columns = [[] for _ in header]
+        self.buffer_size = buffer_size
+        self.num_buffered = 0
+        self.open(path)
+
+    def open(self, path):
+        self.file = open(path, "a")
+        self.file.write(",".join(self.header) + "\n")
+
+    def append(self, values):
+        """Buffers a record, values maps column names to raw values, missing columns are written empty.
+        Raises KeyError for names that are not in the header."""
+        if not values.keys() <= self.names:
+            raise KeyError(f"Columns not in the header {self.header}: {sorted(values.keys() - self.names)}")
+        for column, name in zip(self.columns, self.header):
+            column.append(values.get(name, self.missing))
+        self.num_buffered += 1
+        if self.num_buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.num_buffered == 0:
+            return
+        if self.writer is None:
+            self.write(self.columns)
+        else:
+            self.writer.submit(self.write, self.columns)  # the buffers are handed over, new ones are started
+        self.columns = [[] for _ in self.header]
+        self.num_buffered = 0
+
+    def write(self, columns):
+        formatted = [[format_value(value, digits) for value in column] for column, digits in zip(columns, self.digits)]
+        self.file.write("".join([",".join(row) + "\n" for row in zip(*formatted)]))
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self.writer is None:
+                self.close_file()
+            else:
+                self.writer.submit_close(self.close_file)  # after the queued buffers
+
+    def close_file(self):
+        self.file.close()
+
+
+class ArrowResultTable(ResultTable):
+    """
+    Buffered writer of one result table as a Parquet or Arrow IPC (Feather v2) file, needs pyarrow.
+
+    The columns are written with explicit types and without rounding, each flush adds one row group (Parquet) or
+    record batch (Arrow) of at most buffer_size rows, compressed. Missing values and None are written as nulls.
+    """
+    missing = None
+
+    def __init__(self, path, header, dtypes, file_format="parquet", compression="zstd", buffer_size=65536, writer=None):
+        """
+        Args:
+            path (str): The output file.
+            header (list): The column names, in file order.
+            dtypes (dict): Arrow type name per column name ("int64", "float64", "string", "bool").
+            file_format (str): "parquet" or "arrow".
+            compression (str): Codec of the column chunks, e.g. "zstd", "lz4" or None.
+            buffer_size (int): Number of records per row group / record batch.
+            writer (ResultWriter): Optional background writer, the batches are built and written by its thread.
+        """
+        self.dtypes = dtypes
+        self.file_format = file_format
+        self.compression = compression
+        super().__init__(path, header, None, buffer_size, writer)
+
+    def open(self, path):
+        import pyarrow as pa
+
+        self.schema = pa.schema([(name, pa.type_for_alias(self.dtypes[name])) for name in self.header])
+        if self.file_format == "parquet":
+            import pyarrow.parquet as pq
+            self.file = pq.ParquetWriter(path, self.schema, compression=self.compression or "none")
+        elif self.file_format == "arrow":
+            self.file = pa.ipc.new_file(path, self.schema, options=pa.ipc.IpcWriteOptions(compression=self.compression))
+        else:
+            raise ValueError(f"Unknown result file format: {self.file_format}")
+
+    def write(self, columns):
+        import pyarrow as pa
+
+        arrays = [pa.array(column, type=field.type, from_pandas=True) for column, field in zip(columns, self.schema)]
+        # one row group / record batch per flush
+        self.file.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
@@ -0,0 +1,78 @@
+import queue
+import threading
+import time
+
+
+class ResultWriter:
+    """
+    Background thread that writes the flushed buffers of the result tables (see ResultTable).
+
+    The simulation hands each full buffer to a bounded queue and continues. The writer thread formats, compresses
+    and writes the buffers in the order they were submitted, so a slow disk only stalls the simulation when the
+    queue is full (backpressure). The time spent blocked on a full queue and the queue depth are counted.
+
+    An exception in the writer thread is kept and raised in the simulation at its next submit or at close; the
+    thread keeps draining the queue without writing so the simulation never waits on a dead writer. Functions
+    queued with submit_close (closing the files) still run after an error.
+    """
+    def __init__(self, max_queue_size=8):
+        """
+        Args:
+            max_queue_size (int): Number of buffers that can wait to be written before submit blocks.
+        """
+        self.queue = queue.Queue(max_queue_size)
+        self.error = None
+        self.num_submitted = 0
+        self.max_queue_depth = 0
+        self.blocked_time = 0.0  # seconds the simulation waited on a full queue
+        self.thread = threading.Thread(target=self.run, name="ResultWriter", daemon=True)
+        self.thread.start()
+
+    def submit(self, function, *args):
+        """Queues function(*args) to run in the writer thread, blocks while the queue is full."""
+        self.raise_error()
+        self.put((function, args, False))
+
+    def submit_close(self, function, *args):
+        """Like submit, but function also runs after a failed write and the error is not raised here."""
+        self.put((function, args, True))
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            start = time.perf_counter()
+            self.queue.put(item)
+            self.blocked_time += time.perf_counter() - start
+        self.num_submitted += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            function, args, always = item
+            if self.error is None or always:
+                try:
+                    function(*args)
+                except BaseException as error:
+                    self.error = self.error or error
+
+    def raise_error(self):
+        if self.error is not None:
+            raise RuntimeError("Writing the results failed") from self.error
+
+    def close(self):
+        """Waits until everything submitted is written, raises if the writer failed."""
+        self.queue.put(None)
+        self.thread.join()
+        self.raise_error()
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "num_submitted": self.num_submitted,
+            "blocked_time": self.blocked_time,
+        }
@@ -5,18 +5,39 @@ import logging
 from Ride import Ride
 from Task import Task
 from SimState import SimState
+from ResultTable import ResultTable, ArrowResultTable
+from ResultWriter import ResultWriter
+import Trace
 
 
 class Results:
     def __init__(self, config, verbose=1):
 
-        self.vehicle_rides_name = "vehicle_rides.csv"
-        self.task_data_name = "task_data.csv"
-        self.state_records_name = "state_records.csv"  # Added for state records
+        # output backend of the result tables: "csv", "parquet" or "arrow" (Arrow IPC / Feather v2, needs pyarrow)
+        self.format = config.get("RESULTS_FORMAT", "csv")
+        self.compression = config.get("RESULTS_COMPRESSION", "zstd")  # parquet/arrow only
+        extensions = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+        if self.format not in extensions:
+            raise ValueError(f"Unknown result file format: {self.format}")
+        extension = extensions[self.format]
+        self.vehicle_rides_name = "vehicle_rides" + extension
+        self.task_data_name = "task_data" + extension
+        self.state_records_name = "state_records" + extension  # Added for state records
 
         self.config_name = "config.json"
+        self.routing_cache_name = "routing_cache.json"
+        self.results_writer_name = "results_writer.json"
         self.log_name = "app.log"
+        self.trace_name = "trace.bin"
         self.verbose = verbose
+        self.buffer_size = config.get("RESULTS_BUFFER_SIZE", 65536)  # records buffered per file, see ResultTable
+        # write the full buffers in a background thread, see ResultWriter
+        self.writer = ResultWriter(config.get("RESULTS_QUEUE_SIZE", 8)) if config.get("RESULTS_ASYNC", False) else None
+
+        # traced events (see Trace): "text" logs them to app.log, "journal" writes them to trace.bin for decoding later
+        self.trace_mode = config.get("TRACE_MODE", "text")
+        self.trace_categories = config.get("TRACE_CATEGORIES", Trace.DEFAULT_CATEGORIES)
+        self.tracer = Trace.Tracer()  # the tracer of this run, all categories disabled until setup_log
 
         self.mkpath()
         self.mkdir()
@@ -43,6 +64,8 @@ class Results:
         if self.verbose == 0:
             # Level 0: No logging
             logging.disable(logging.CRITICAL)  # Disable all logging
+            self.tracer.close()  # and all traced events
+            return
         elif self.verbose == 1:
             # Level 1: Logging to file only
             logging.basicConfig(
@@ -64,13 +87,22 @@ class Results:
             formatter = logging.Formatter('%(message)s')
             console.setFormatter(formatter)
             logging.getLogger('').addHandler(console)
+        self.tracer.configure(self.trace_categories, self.trace_mode, os.path.join(self.path, self.trace_name))
+
+    def open_table(self, name, record_class):
+        """ Opens a result table with the columns of record_class (Ride, Task or SimState) in the output format """
+        path = os.path.join(self.path, name)
+        if self.format == "csv":
+            return ResultTable(path, record_class.header, record_class.digits, self.buffer_size, self.writer)
+        return ArrowResultTable(path, record_class.header, record_class.dtypes, self.format, self.compression, self.buffer_size,
+                                self.writer)
 
     def open_user_rides(self):
-        self.user_trips = open(os.path.join(self.path, self.vehicle_rides_name), "a")
-        self.user_trips.write(Ride.get_header())
+        self.user_trips = self.open_table(self.vehicle_rides_name, Ride)
 
     def add_user_trip(self, user_trip):
-        self.user_trips.write(user_trip.get_data())
+        """ user_trip maps the columns of Ride.header to raw values """
+        self.user_trips.append(user_trip)
 
     def close_user_trips(self):
         self.user_trips.close()
@@ -79,27 +111,50 @@ class Results:
         with open(os.path.join(self.path, self.config_name), "w") as f:
             json.dump(config, f)
 
+    def save_routing_cache_stats(self, stats):
+        with open(os.path.join(self.path, self.routing_cache_name), "w") as f:
+            json.dump(stats, f)
+
     def open_tasks(self):
-        self.task_data_file = open(os.path.join(self.path, self.task_data_name), "a")
-        self.task_data_file.write(Task.get_header())  # Changed from Ride.get_header()
+        self.task_data_file = self.open_table(self.task_data_name, Task)
 
     def add_task(self, task):
-        self.task_data_file.write(task.get_data())  # Changed to write task data
+        """ task maps the columns of Task.header to raw values """
+        self.task_data_file.append(task)
 
     def close_tasks(self):
         self.task_data_file.close()
 
     def open_state_records(self):  # Added to open state records file
-        self.state_records_file = open(os.path.join(self.path, self.state_records_name), "a")
-        self.state_records_file.write(SimState.get_header())  # Changed from Ride.get_header()
+        self.state_records_file = self.open_table(self.state_records_name, SimState)
 
     def add_state_record(self, state_data):  # Added to write state records
-        self.state_records_file.write(state_data.get_data())
+        """ state_data maps the columns of SimState.header to raw values """
+        self.state_records_file.append(state_data)
 
     def close_state_records(self):  # Added to close state records file
         self.state_records_file.close()
 
+    def writer_stats(self):
+        """ Queue depth and time blocked on backpressure of the background writer, None without one """
+        return None if self.writer is None else self.writer.stats()
+
     def close(self):
-        self.close_user_trips()
-        self.close_tasks()
-        self.close_state_records()  # Added to close state records file
+        """ Closes all result tables and the tracer and waits for the background writer, even if one of them fails.
+        The first error is raised at the end. """
+        error = None
+        for close in (self.close_user_trips, self.close_tasks, self.close_state_records, self.tracer.close):
+            try:
+                close()
+            except Exception as exception:
+                error = error or exception
+        if self.writer is not None:
+            try:
+                self.writer.close()  # waits for all writes, raises if one failed
+            except Exception as exception:
+                error = error or exception
+            finally:
+                with open(os.path.join(self.path, self.results_writer_name), "w") as f:
+                    json.dump(self.writer.stats(), f)
+        if error is not None:
+            raise error
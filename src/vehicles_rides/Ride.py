@@ -1,5 +1,4 @@
 class Ride:
-    id_count = -1
     header = [
         "vehicle_id",
         "user_id",
@@ -18,39 +17,37 @@ class Ride:
         "battery_out"
     ]
 
-    def __init__(self):
-        self.next_id()
-        self.id = Ride.id_count
+    # column types of the parquet/arrow output, see ArrowResultTable
+    dtypes = {
+        "vehicle_id": "int64",
+        "user_id": "int64",
+        "time_departure": "float64",
+        "time_target": "float64",
+        "status": "string",
+        "time_ride": "float64",
+        "origin_parking_spot": "int64",
+        "destination_parking_spot": "int64",
+        "origin_lon": "float64",
+        "origin_lat": "float64",
+        "destination_lon": "float64",
+        "destination_lat": "float64",
+        "ride_distance": "float64",
+        "battery_in": "float64",
+        "battery_out": "float64"
+    }
 
-        self.store = dict.fromkeys(Ride.header, "")
-
-    @classmethod
-    def reset(cls):
-        Ride.id_count = -1
-
-    def next_id(self):
-        Ride.id_count += 1
-
-    @staticmethod
-    def get_header():
-        return ",".join(Ride.header) + "\n"
-
-    def get_data(self):
-        return ",".join(map(str, self.store.values())) + "\n"
-
-    def set(self, key, value, digits=2):
-        if key in self.store.keys():
-            if isinstance(value, bool):
-                value = int(value)
-                value = str(value)
-            elif isinstance(value, int):
-                value = str(value)
-            elif isinstance(value, float):
-                if digits == 0:
-                    value = int(value)
-                else:
-                    value = round(value, digits)
-                value = str(value)
-            self.store[key] = value
-        else:
-            raise BaseException
+    # rounding digits of the columns, see ResultTable.format_value (2 for the others)
+    digits = {
+        "time_departure": 0,
+        "time_target": 0,
+        "time_ride": 0,
+        "origin_parking_spot": 0,
+        "destination_parking_spot": 0,
+        "origin_lon": 5,
+        "origin_lat": 5,
+        "destination_lon": 5,
+        "destination_lat": 5,
+        "ride_distance": 0,
+        "battery_in": 3,
+        "battery_out": 3
+    }
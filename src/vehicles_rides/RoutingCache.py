@@ -0,0 +1,101 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+
+class RoutingCache:
+    """
+    Cache of shortest path lengths keyed by (graph, origin_node, destination_node).
+
+    The key uses node ids, so every location snapped to the same node shares the entry. The graph part of the key
+    is the GraphStore key of the graph, which makes the entries valid across runs on the same area and lets the
+    cache be spilled to disk and reloaded by later runs.
+    """
+    policies = ("lru", "fifo")
+
+    def __init__(self, maxsize=16384, policy="lru", spill_path=None):
+        """
+        Args:
+            maxsize (int): Maximum number of entries, None for an unbounded cache.
+            policy (str): Eviction policy, "lru" (least recently used) or "fifo" (oldest inserted).
+            spill_path (str): Optional .npz file the cache is loaded from and saved to.
+        """
+        if policy not in self.policies:
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.spill_path = spill_path
+        self.store = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.spill_path is not None and os.path.isfile(self.spill_path):
+            self.load()
+
+    def __len__(self):
+        return len(self.store)
+
+    def get(self, key):
+        """Returns the cached length for key, or None on a miss."""
+        length = self.store.get(key)
+        if length is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.policy == "lru":
+            self.store.move_to_end(key)
+        return length
+
+    def put(self, key, length):
+        self.store[key] = length
+        if self.maxsize is not None:
+            while len(self.store) > self.maxsize:
+                self.store.popitem(last=False)
+                self.evictions += 1
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Returns the hit/miss/eviction counters of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "policy": self.policy,
+            "maxsize": self.maxsize,
+            "size": len(self.store),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else None,
+        }
+
+    def save(self):
+        """Spills the cache to spill_path (no-op without a spill path)."""
+        if self.spill_path is None:
+            return
+        graphs = sorted({graph for graph, _, _ in self.store})
+        graph_index = {graph: i for i, graph in enumerate(graphs)}
+        num_entries = len(self.store)
+        tmp_path = self.spill_path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            graphs=np.array(graphs, dtype=str),
+            graph=np.fromiter((graph_index[graph] for graph, _, _ in self.store), dtype=np.int32, count=num_entries),
+            origin=np.fromiter((origin for _, origin, _ in self.store), dtype=np.int64, count=num_entries),
+            destination=np.fromiter((destination for _, _, destination in self.store), dtype=np.int64, count=num_entries),
+            length=np.fromiter(self.store.values(), dtype=np.float64, count=num_entries),
+        )
+        os.replace(tmp_path, self.spill_path)
+
+    def load(self):
+        """Loads the entries spilled to spill_path, in their original order."""
+        with np.load(self.spill_path) as data:
+            graphs = data["graphs"].tolist()
+            entries = zip(data["graph"].tolist(), data["origin"].tolist(), data["destination"].tolist(), data["length"].tolist())
+            for graph, origin, destination, length in entries:
+                self.put((graphs[graph], origin, destination), length)
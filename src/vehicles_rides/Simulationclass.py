@@ -1,4 +1,3 @@
-import logging
 import os
 import random
 
@@ -9,9 +8,13 @@ import time
 import numpy as np
 
 #from Datainterface import DataInterface
+from DemandFeeder import DemandFeeder
+from EventKernel import EventKernel
 from ParkingSpotclass import ParkingSpot
 from Rider import Rider
 from Vehicleclass import Vehicle
+from FleetState import FleetState
+from BatteryScheduler import BatteryScheduler
 from Location import Location
 from Results import Results
 from Datainterface import DataInterface
@@ -19,15 +22,17 @@ from TaskManager import TaskManager
 from FleetSpecialist import FleetSpecialist
 from Map import Map
 from SimState import SimState
+import Trace
 
 
 class RideSimulationEngine:
     def __init__(self, config, parking_spots_or_data_path, map_or_area_ploygon_path, demand_data_path=None, verbose=1, fleet_maintenance=1, seed=None):
         # simulation environment and configuration parameters
         print(f"Setting up simulation environment for {config['CITY']}")
-        self.env = simpy.Environment()
+        self.env = self.init_environment(config.get("ENGINE", "simpy"))
         self.config = config
         self.results = Results(self.config, verbose=verbose)
+        self.tracer = self.results.tracer  # traced events of this engine, see Trace
 
         # Set the random seed for reproducibility
         self.seed = seed
@@ -44,23 +49,44 @@ class RideSimulationEngine:
         # support classes
         #self.map = Map() # all distance and location function calls
         self.map = self.init_map(map_or_area_ploygon_path)
-        self.data_interface = DataInterface(self.env, self.config) # all function calls which demand diving into data
-        self.task_manager = TaskManager(self.results)
+        self.data_interface = DataInterface(self.env, self.config, self.map) # all function calls which demand diving into data
+        # "lazy": idle battery drain evaluated on demand by one BatteryScheduler, "process": one idle process per vehicle
+        self.battery_scheduler = BatteryScheduler(self.env) if self.config.get("BATTERY_MODEL", "process") == "lazy" else None
+        self.task_manager = TaskManager(self.env, self.results, self.map, self.config.get("TASK_INDEX_CELL_SIZE"),
+                                        self.config.get("DISPATCH_EPOCH", 0))
 
         # storage for city state TODO skip put all in data_interface??
         self.parking_spots = []
         self.vehicles = []
-        self.riders = []
+        self.fleet_state = None  # arrays of the vehicles' state, see FleetState
+        self.demand_feeder = None  # creates the riders during the run, see DemandFeeder
 
         self.num_of_parking_spots = 0
         self.num_of_vehicles = config["NUM_OF_VEHICLES"]
 
         self.start()
 
+    @staticmethod
+    def init_environment(engine):
+        """ "simpy" for simpy.Environment, "kernel" for the lighter EventKernel (same event order and results) """
+        if engine == "simpy":
+            return simpy.Environment()
+        elif engine == "kernel":
+            return EventKernel()
+        else:
+            raise ValueError(f"Unknown engine: {engine}")
+
     def init_map(self, map_or_area_ploygon_path):
         if isinstance(map_or_area_ploygon_path, str):
             print("Loading map")
-            return Map(map_or_area_ploygon_path)
+            return Map(map_or_area_ploygon_path,
+                       graph_cache_dir=self.config.get("GRAPH_CACHE_DIR"),
+                       cache_only=self.config.get("GRAPH_CACHE_ONLY", False),
+                       routing_backend=self.config.get("ROUTING_BACKEND", "csr"),
+                       routing_cache_size=self.config.get("ROUTING_CACHE_SIZE", 16384),
+                       routing_cache_policy=self.config.get("ROUTING_CACHE_POLICY", "lru"),
+                       routing_cache_path=self.config.get("ROUTING_CACHE_PATH"),
+                       distance_matrix_max_nodes=self.config.get("DISTANCE_MATRIX_MAX_NODES", 4096))
         elif isinstance(map_or_area_ploygon_path, Map):
             return map_or_area_ploygon_path
         else:
@@ -88,45 +114,54 @@ class RideSimulationEngine:
         else:
             self.parking_spots = self.parking_spots_or_data_path
         self.num_of_parking_spots = len(self.parking_spots)
-        logging.info("[%.0f] Number of parking spots placed: %d. Number of vehicles: %d. Number of vehicles per parking spot: %.2f" % (self.env.now, self.num_of_parking_spots, self.config["NUM_OF_VEHICLES"], self.config["NUM_OF_VEHICLES"]/self.num_of_parking_spots))
+        if self.tracer.simulation:
+            self.tracer.emit(Trace.PARKING_SPOTS_PLACED, self.env.now, self.num_of_parking_spots, self.config["NUM_OF_VEHICLES"],
+                              self.config["NUM_OF_VEHICLES"]/self.num_of_parking_spots)
 
 
     @staticmethod
-    def load_parking_spots(parking_spot_data_path, map_instance):
+    def load_parking_spots(parking_spot_data_path, map_instance, precompute_distances=True):
         print("Loading parking spots")
         ParkingSpot.reset()
-        parking_spots_data = pd.read_csv(parking_spot_data_path)
-        parking_spots = []
-        for index, row in parking_spots_data.iterrows():
-            #if index % 4 != 0:  # Skip every 4th parking spot
-            parking_spots.append(ParkingSpot(Location(row['LONGITUDE'], row['LATITUDE'], map=map_instance)))
+        parking_spots_data = pd.read_csv(parking_spot_data_path, usecols=["LONGITUDE", "LATITUDE"])
+        parking_spots = [ParkingSpot(Location(lon, lat)) for lon, lat in
+                         zip(parking_spots_data["LONGITUDE"].tolist(), parking_spots_data["LATITUDE"].tolist())]
+        # snap all parking spots to the graphs in one query per graph
+        locations = [parking_spot.location for parking_spot in parking_spots]
+        map_instance.snap_locations(locations, "drive")
+        map_instance.snap_locations(locations, "bike")
         print("making kdtree")
         map_instance.create_kdtree(parking_spots)
+        if precompute_distances:
+            print("precomputing parking spot distances")
+            map_instance.build_distance_matrices(parking_spots)
         return parking_spots, map_instance
     
     @staticmethod
     def find_parking_spot_neighbors(config, parking_spots, map):
         print("Finding neighbors for each parking spot")
-        for parking_spot in parking_spots:
-            # Query the KDTree for indices of neighbors within walk_radius
-            nearby_parking_spots_indices = map.find_nearby_parking_spot_indices(parking_spot.location, config["WALK_RADIUS"])
-            # Filter out the parking spot's own index
-            parking_spot.neighbor_parking_spots = [parking_spots[i] for i in nearby_parking_spots_indices if i != parking_spot.id]
-        print("total number of neighbors: " + str(sum(len(parking_spot.neighbor_parking_spots) for parking_spot in parking_spots)))
+        # one batched KD-tree query for all parking spots, stored as CSR arrays on the map
+        map.build_neighbor_graph(config["WALK_RADIUS"])
+        print("total number of neighbors: " + str(len(map.neighbor_graph[1])))
         return parking_spots
 
     def init_vehicles(self):
         print("Placing vehicles")
         Vehicle.reset()
-        # Places vehicles in random parking spots until the number of vehicles is reached
-        vehicles_placed = 0
-        while not vehicles_placed == self.config["NUM_OF_VEHICLES"]:
-            random_spot = random.choice(self.parking_spots)
-            battery_level = self.data_interface.get_truncated_normal().rvs()
-            vehicle = Vehicle(self.env, self.map, self.config, self.data_interface, self.task_manager, random_spot, battery_level=battery_level)
-            random_spot.vehicles.append(vehicle)
+        # Places vehicles in random parking spots, all spots and battery levels are drawn in one go
+        # (the same random numbers as drawing them vehicle by vehicle)
+        num_vehicles = self.config["NUM_OF_VEHICLES"]
+        spot_ids = [random.randrange(len(self.parking_spots)) for _ in range(num_vehicles)]
+        battery_levels = self.data_interface.get_truncated_normal().rvs(size=num_vehicles)
+        self.fleet_state = FleetState(num_vehicles)
+        indices = self.fleet_state.add_vehicles(battery_levels, spot_ids)
+        for index, spot_id, battery_level in zip(indices, spot_ids, battery_levels.tolist()):
+            random_spot = self.parking_spots[spot_id]
+            vehicle = Vehicle(self.env, self.map, self.config, self.data_interface, self.task_manager, random_spot, battery_level=battery_level,
+                              battery_scheduler=self.battery_scheduler, fleet_state=self.fleet_state, index=index,
+                              tracer=self.tracer)
+            random_spot.add_vehicle(vehicle)
             self.vehicles.append(vehicle) #TODO: check if this is the right way to do it, double store?
-            vehicles_placed += 1
 
     # Fleet specialist initialization
     def init_fleet_specialists(self):
@@ -139,34 +174,86 @@ class RideSimulationEngine:
             focus_area_path = os.path.join("data","area","fleet_spec","fs"+str(i)+".geojson") if focus_area else None
             fleet_specialist = FleetSpecialist(self.env, self.map, self.config, self.results, self.task_manager, start_time, starting_location, self.data_interface, focus_area_path)
             fleet_specialist.schedule()
-        logging.info("[%.0f] Number of fleet specialists initilised: %d" % (self.env.now, self.num_of_fleet_specialists))
+        if self.tracer.simulation:
+            self.tracer.emit(Trace.FLEET_SPECIALISTS_INITIALIZED, self.env.now, self.num_of_fleet_specialists)
 
 
     def load_demand(self, demand_data_path):
+        """ Streams the demand from a time-sorted CSV (or Parquet) file into the simulation, see DemandFeeder """
         print("Loading demand")
-        demand_data = pd.read_csv(demand_data_path)
-        for index, row in demand_data.iterrows():
-            origin_parking_id = self.map.find_nearest_parking_spot(Location(row["start_lon"], row["start_lat"]))
-            destination_parking_id = self.map.find_nearest_parking_spot(Location(row["target_lon"], row["target_lat"]))
-
-            user = Rider(
-                            self.env,
-                            self.config,
-                            self.data_interface,
-                            self.results,
-                            self.parking_spots[origin_parking_id],
-                            self.parking_spots[destination_parking_id],
-                            row["start_time"],
-                            row["target_time"],
-                            row["distance"])
-            self.riders.append(user)
-            user.start()
-            # no need to load more than simulation length
-            if row["start_time"] > 3600 * 24 * self.config["NUM_SIMULATED_DAYS"]:
+        chunksize = self.config.get("DEMAND_CHUNK_SIZE", 100000)
+        # the trips are counted up front from the start_time column alone, so the planned trips are logged at t=0
+        num_of_trips = sum(len(chunk) for chunk in self.read_demand_chunks(demand_data_path, chunksize, ["start_time"]))
+        self.demand_feeder = DemandFeeder(self.env, self.read_demand(demand_data_path, chunksize), self.create_rider, self.tracer)
+        self.demand_feeder.start()
+        if self.tracer.simulation:
+            self.tracer.emit(Trace.TRIPS_PLANNED, self.env.now, num_of_trips, self.config["NUM_SIMULATED_DAYS"],
+                              num_of_trips/self.config["NUM_SIMULATED_DAYS"]/self.num_of_vehicles)
+
+    def read_demand_chunks(self, demand_data_path, chunksize, columns=None):
+        """
+        Yields the rows of a demand file that start before the end of the simulation, chunk by chunk.
+
+        Raises ValueError at the first row that starts earlier than a row before it: the feeder injects the trips
+        in file order, so an unsorted file would start trips late.
+
+        Args:
+            demand_data_path (str): CSV or Parquet file.
+            chunksize (int): Number of rows per chunk.
+            columns (list): Optional, the columns to read (all by default).
+        """
+        horizon = 3600 * 24 * self.config["NUM_SIMULATED_DAYS"]
+        if demand_data_path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            batches = pq.ParquetFile(demand_data_path).iter_batches(batch_size=chunksize, columns=columns)
+            chunks = (batch.to_pandas() for batch in batches)
+        else:
+            chunks = pd.read_csv(demand_data_path, chunksize=chunksize, usecols=columns)
+
+        last_start_time = None
+        for demand_data in chunks:
+            if demand_data.empty:
+                continue
+            start_times = demand_data["start_time"].to_numpy()
+            # sorted up to a row means the latest start time before it is the one of the previous row
+            times = start_times if last_start_time is None else np.concatenate(([last_start_time], start_times))
+            unsorted = np.flatnonzero(times[1:] < times[:-1])
+            if len(unsorted):
+                row = unsorted[0]
+                raise ValueError(f"Demand file {demand_data_path} is not sorted by start_time: a trip at {times[row + 1]} "
+                                 f"comes after a trip at {times[row]}")
+            last_start_time = start_times[-1].item()
+            # the trips at or after the horizon are never reached by run(until=horizon), later chunks are beyond it too
+            demand_data = demand_data[start_times < horizon]
+            if demand_data.empty:
                 break
+            yield demand_data
+
+    def read_demand(self, demand_data_path, chunksize):
+        """ Yields the trips of a demand file, read and snapped to parking spots chunk by chunk """
+        for demand_data in self.read_demand_chunks(demand_data_path, chunksize):
+            num_trips = len(demand_data)
+
+            # snap all origins and destinations of the chunk to parking spots in one query
+            lons = np.concatenate((demand_data["start_lon"].to_numpy(), demand_data["target_lon"].to_numpy()))
+            lats = np.concatenate((demand_data["start_lat"].to_numpy(), demand_data["target_lat"].to_numpy()))
+            parking_ids = self.map.find_nearest_parking_spots(lons, lats)
+
+            ride_distances = demand_data["distance"].tolist() if "distance" in demand_data else [None] * num_trips
+            yield from zip(demand_data["start_time"].tolist(), parking_ids[:num_trips].tolist(), parking_ids[num_trips:].tolist(),
+                           demand_data["target_time"].tolist(), ride_distances)
 
-        logging.info("[%.0f] Number of trips planned is %d under %d day(s). TVD: %d" % 
-                     (self.env.now, len(self.riders), self.config["NUM_SIMULATED_DAYS"], len(self.riders)/self.config["NUM_SIMULATED_DAYS"]/self.num_of_vehicles))
+    def create_rider(self, departure_time, origin_id, destination_id, target_time=None, ride_distance=None):
+        return Rider(
+            self.env,
+            self.config,
+            self.data_interface,
+            self.results,
+            self.parking_spots[origin_id],
+            self.parking_spots[destination_id],
+            departure_time,
+            target_time,
+            ride_distance)
 
     def generate_uniform_demand(self, random_time=False):
         """This method generates a uniformly distributed ride-demand over time and parking spots"""
@@ -177,6 +264,18 @@ class RideSimulationEngine:
         possible_start_times = self.config["NUM_SIMULATED_DAYS"] * 24 * 3600
         interval = possible_start_times // num_of_trips
 
+        trips = self.uniform_trips(num_of_trips, interval, possible_start_times, random_time)
+        if random_time:
+            # random start times must be drawn up front to sort them, ties keep the order they were drawn in
+            trips = sorted(trips, key=lambda trip: trip[0])
+        self.demand_feeder = DemandFeeder(self.env, trips, self.create_rider, self.tracer)
+        self.demand_feeder.start()
+
+        if self.tracer.simulation:
+            self.tracer.emit(Trace.TRIPS_PLANNED, self.env.now, num_of_trips, self.config["NUM_SIMULATED_DAYS"], self.config["TVD"])
+
+    def uniform_trips(self, num_of_trips, interval, possible_start_times, random_time):
+        """ Yields the trips of generate_uniform_demand, drawing the random numbers in the same order as before """
         for i in range(num_of_trips):
             # get random origin and destination ps which are not the same
             origin_id = 0
@@ -189,45 +288,30 @@ class RideSimulationEngine:
                 start_time = random.randint(0, possible_start_times)
             else:
                 start_time = round(i * interval)
-            
-            user = Rider(
-                self.env,
-                self.config,
-                self.data_interface,
-                self.results,
-                self.parking_spots[origin_id],
-                self.parking_spots[destination_id],
-                start_time)
-            self.riders.append(user)
-            user.start()
-
-        logging.info("[%.0f] Number of trips planned is %d under %d day(s). TVD: %d" % 
-                     (self.env.now, num_of_trips, self.config["NUM_SIMULATED_DAYS"], self.config["TVD"]))
+            yield (start_time, origin_id, destination_id)
 
     def run(self, until):
         print("Running simulation")
-        self.env.process(self.periodic_save_state(60*15))  # Schedule the periodic save state
+        self.env.process(self.periodic_save_state(self.config.get("STATE_SAVE_PERIOD", 60*15)))  # Schedule the periodic save state
+        self.map.routing_cache.reset_stats()  # the map may be shared between runs, count this run only
         self.env.run(until)
         print("remaining tasks: " + str(len(self.task_manager.tasks)))
         self.task_manager.log_remaining_tasks()
+        self.results.save_routing_cache_stats(self.map.routing_cache.stats())
+        self.map.routing_cache.save()
         self.results.close()
     
     def periodic_save_state(self, period):
         self.state = SimState(self.results)
         while True:
             self.state.time = self.env.now
-            self.state.avg_battery_level = sum([vehicle.battery.level for vehicle in self.vehicles]) / self.num_of_vehicles
-            self.state.num_bounties = len([task for task in self.task_manager.tasks if task.bounty])
+            # O(1) snapshot from the online accumulators of the fleet state
+            self.state.avg_battery_level = self.fleet_state.avg_battery_level()
+            self.state.num_bounties = self.fleet_state.num_bounties()
             self.state.num_task = len(self.task_manager.tasks)
             
             # Calculate the Gini coefficient for the number of vehicles per parking spot
-            vehicles_per_spot = [len(parking_spot.vehicles) for parking_spot in self.parking_spots]
-            sorted_vehicles = sorted(vehicles_per_spot)
-            cumulative_vehicles = np.cumsum(sorted_vehicles)
-            sum_of_cumulative = cumulative_vehicles.sum()
-            gini_numerator = sum_of_cumulative - (cumulative_vehicles[-1] / 2.0)
-            gini_denominator = self.num_of_vehicles * len(vehicles_per_spot) / 2.0
-            self.state.vehicle_distribution_gini = (gini_denominator - gini_numerator) / gini_denominator
+            self.state.vehicle_distribution_gini = self.fleet_state.vehicle_distribution_gini(len(self.parking_spots))
             
             self.state.save_state()
             yield self.env.timeout(period)
@@ -20,6 +20,37 @@ class Task:
         "battery_in",
         "battery_out"
     ]
+    # column types of the parquet/arrow output, see ArrowResultTable
+    dtypes = {
+        "task_id": "int64",
+        "task_type": "string",
+        "bounty": "bool",
+        "vehicle_id": "int64",
+        "priority": "float64",
+        "lon": "float64",
+        "lat": "float64",
+        "target_time": "float64",
+        "created_time": "float64",
+        "status": "string",
+        "bounty_time": "float64",
+        "resolved_by": "int64",
+        "resolved_time": "float64",
+        "time_spent": "float64",
+        "distance_driven": "float64",
+        "time_open": "float64",
+        "battery_in": "float64",
+        "battery_out": "float64"
+    }
+    # rounding digits of the columns, see ResultTable.format_value (2 for the others)
+    digits = {
+        "lon": 5,
+        "lat": 5,
+        "target_time": 0,
+        "created_time": 0,
+        "distance_driven": 0,
+        "battery_in": 3,
+        "battery_out": 3
+    }
     
     def __init__(self, task_type, created_time, vehicle=None, bounty=False, priority=None, target_time=None, battery_in=None):
         self.next_id()
@@ -38,9 +69,6 @@ class Task:
         self.battery_in = battery_in
         self.battery_out = None
 
-        # storage for data collection
-        self.store = dict.fromkeys(Task.header, "")
-
     # dynamic retrival of the task location
     @property
     def location(self):
@@ -52,28 +80,3 @@ class Task:
 
     def next_id(cls):
         Task.id_count += 1
-
-    @staticmethod
-    def get_header():
-        return ",".join(Task.header) + "\n"
-    
-    def get_data(self):
-        return ",".join(map(str, self.store.values())) + "\n"
-    
-    def set(self, key, value, digits=2):
-        if key in self.store.keys():
-            if isinstance(value, bool):
-                value = int(value)
-                value = str(value)
-            elif isinstance(value, int):
-                value = str(value)
-            elif isinstance(value, float):
-                if digits == 0:
-                    value = int(value)
-                else:
-                    value = round(value, digits)
-                value = str(value)
-            self.store[key] = value
-        else:
-            raise BaseException
-
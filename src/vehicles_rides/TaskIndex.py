@@ -0,0 +1,200 @@
+import heapq
+import math
+
+
+class TaskIndex:
+    """
+    Grid hash of tasks over projected (UTM) coordinates, for nearest task queries.
+
+    The plane is divided into square cells and every task is stored in the cell of its location. Insert, move
+    and remove are O(1). A nearest query scans rings of cells around the query point and stops as soon as no
+    unscanned cell can hold a closer task. By default the cell size follows the task density: the grid is
+    rebuilt (amortized O(1) per update) whenever the number of tasks has doubled or halved, so a query scans a
+    few tasks whether the backlog holds a hundred or fifty thousand tasks.
+
+    Task.location follows the vehicle, so the owner must call update when a task's vehicle has moved.
+    """
+    def __init__(self, project, cell_size=None, tasks_per_cell=2, linear_scan_size=32):
+        """
+        Args:
+            project (callable): Maps a Location to projected (x, y) coordinates in meters.
+            cell_size (float): Side of the grid cells in meters, None to adapt it to the task density.
+            tasks_per_cell (float): Average number of tasks per cell the adaptive cell size aims for.
+            linear_scan_size (int): Up to this number of tasks nearest queries check all tasks directly.
+        """
+        self.project = project
+        self.adaptive = cell_size is None
+        self.cell_size = 500 if cell_size is None else cell_size
+        self.tasks_per_cell = tasks_per_cell
+        self.linear_scan_size = linear_scan_size
+        self.rebuild_size = linear_scan_size  # number of tasks at the last rebuild
+        self.cells = {}         # (i, j) -> set of tasks
+        self.entries = {}       # task -> (x, y, cell)
+        self.spot_points = {}   # parking_spot_id -> (x, y), parking spots do not move
+        # cell bounds of all tasks indexed since the last rebuild, limits the ring search
+        self.bounds = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, task):
+        return task in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def get_point(self, location):
+        """Returns the projected coordinates of a location, cached for parking spot locations."""
+        if location.parking_spot_id is None:
+            return self.project(location)
+        point = self.spot_points.get(location.parking_spot_id)
+        if point is None:
+            point = self.spot_points[location.parking_spot_id] = self.project(location)
+        return point
+
+    def get_cell(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def update(self, task):
+        """Inserts a task, or moves it to the current location of its vehicle."""
+        x, y = self.get_point(task.location)
+        cell = self.get_cell(x, y)
+        entry = self.entries.get(task)
+        if entry is not None:
+            if entry[2] == cell:
+                self.entries[task] = (x, y, cell)
+                return
+            self.discard(task)
+        self.insert(task, x, y, cell)
+        if self.adaptive and len(self.entries) >= 2 * self.rebuild_size:
+            self.rebuild()
+
+    def insert(self, task, x, y, cell):
+        self.entries[task] = (x, y, cell)
+        self.cells.setdefault(cell, set()).add(task)
+        if self.bounds is None:
+            self.bounds = [cell[0], cell[1], cell[0], cell[1]]
+        else:
+            self.bounds = [min(self.bounds[0], cell[0]), min(self.bounds[1], cell[1]),
+                           max(self.bounds[2], cell[0]), max(self.bounds[3], cell[1])]
+
+    def discard(self, task):
+        """Removes a task if it is in the index."""
+        entry = self.entries.pop(task, None)
+        if entry is None:
+            return
+        tasks = self.cells[entry[2]]
+        tasks.discard(task)
+        if not tasks:
+            del self.cells[entry[2]]
+        if self.adaptive and self.rebuild_size > self.linear_scan_size and 2 * len(self.entries) <= self.rebuild_size:
+            self.rebuild()
+
+    def rebuild(self):
+        """Sets the cell size so that the tasks' bounding box holds tasks_per_cell tasks per cell, and re-inserts them."""
+        self.rebuild_size = max(len(self.entries), self.linear_scan_size)
+        entries = list(self.entries.items())
+        self.cells, self.entries, self.bounds = {}, {}, None
+        if entries:
+            xs = [x for _, (x, _, _) in entries]
+            ys = [y for _, (_, y, _) in entries]
+            area = max(max(xs) - min(xs), 1.0) * max(max(ys) - min(ys), 1.0)
+            self.cell_size = math.sqrt(area * self.tasks_per_cell / len(entries))
+        for task, (x, y, _) in entries:
+            self.insert(task, x, y, self.get_cell(x, y))
+
+    def nearest(self, location, k=1, accept=None):
+        """
+        Finds the k tasks nearest to a location (euclidean distance in the projection).
+
+        Args:
+            location (Location): The query location.
+            k (int): Number of tasks to return.
+            accept (callable): Optional filter, only tasks for which accept(task) is true are returned.
+
+        Returns:
+            list: (distance, task) pairs sorted by distance, ties broken by task id. Fewer than k if there
+                  are not enough (accepted) tasks.
+        """
+        if not self.entries or k <= 0:
+            return []
+        x, y = self.get_point(location)
+        if len(self.entries) <= self.linear_scan_size:
+            return self.select(x, y, self.entries, k, accept)
+
+        ci, cj = self.get_cell(x, y)
+        # rings beyond this one cannot hold any task
+        max_ring = max(ci - self.bounds[0], cj - self.bounds[1], self.bounds[2] - ci, self.bounds[3] - cj)
+        best = []   # max heap of the k nearest so far: (-distance, -task id, task)
+        ring = 0
+        while ring <= max_ring:
+            for cell in self.ring_cells(ci, cj, ring):
+                for task in self.cells.get(cell, ()):
+                    if accept is not None and not accept(task):
+                        continue
+                    tx, ty, _ = self.entries[task]
+                    item = (-math.hypot(tx - x, ty - y), -task.id, task)
+                    if len(best) < k:
+                        heapq.heappush(best, item)
+                    elif item[:2] > best[0][:2]:
+                        heapq.heapreplace(best, item)
+            # every cell outside ring r is at least r * cell_size away from the query point
+            if len(best) == k and -best[0][0] <= ring * self.cell_size:
+                break
+            ring += 1
+        return [(-distance, task) for distance, _, task in sorted(best, reverse=True)]
+
+    def select(self, x, y, tasks, k, accept):
+        """Nearest k of tasks by a direct scan."""
+        candidates = [(math.hypot(self.entries[task][0] - x, self.entries[task][1] - y), task.id, task)
+                      for task in tasks if accept is None or accept(task)]
+        return [(distance, task) for distance, _, task in heapq.nsmallest(k, candidates)]
+
+    @staticmethod
+    def ring_cells(ci, cj, ring):
+        """The cells at Chebyshev distance ring from cell (ci, cj)."""
+        if ring == 0:
+            yield (ci, cj)
+            return
+        for i in range(ci - ring, ci + ring + 1):
+            yield (i, cj - ring)
+            yield (i, cj + ring)
+        for j in range(cj - ring + 1, cj + ring):
+            yield (ci - ring, j)
+            yield (ci + ring, j)
+
+
+if __name__ == "__main__":
+    # Benchmark against a linear min() scan, with tasks spread over a 20 x 20 km city
+    import random
+    import time
+
+    class Point:
+        def __init__(self, x, y):
+            self.lon, self.lat = x, y
+            self.parking_spot_id = None
+
+    class DummyTask:
+        def __init__(self, id, location):
+            self.id = id
+            self.location = location
+
+    random.seed(0)
+    queries = [Point(random.uniform(0, 20000), random.uniform(0, 20000)) for _ in range(200)]
+    for num_tasks in (100, 1000, 10000, 50000):
+        index = TaskIndex(lambda location: (location.lon, location.lat))
+        tasks = [DummyTask(i, Point(random.uniform(0, 20000), random.uniform(0, 20000))) for i in range(num_tasks)]
+        for task in tasks:
+            index.update(task)
+
+        start = time.perf_counter()
+        found = [index.nearest(query)[0][1] for query in queries]
+        index_time = (time.perf_counter() - start) / len(queries)
+
+        start = time.perf_counter()
+        expected = [min(tasks, key=lambda task: (math.hypot(task.location.lon - query.lon, task.location.lat - query.lat), task.id))
+                    for query in queries]
+        scan_time = (time.perf_counter() - start) / len(queries)
+
+        assert found == expected
+        print("%6d tasks: index %8.1f us/query, linear scan %10.1f us/query" % (num_tasks, index_time * 1e6, scan_time * 1e6))
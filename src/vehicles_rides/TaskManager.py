@@ -1,8 +1,24 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+import Distance
+from TaskIndex import TaskIndex
+
+
 class TaskManager:
-    def __init__(self, results):
+    def __init__(self, env, results, map, task_index_cell_size=None, dispatch_epoch=0):
+        self.env = env
         self.results = results
         self.fleet_specialists = set()  # Set of fleet specialists
         self.tasks = set()              # Set of Task objects
+        # spatial index of the available tasks (UTM coordinates), kept up to date by update_task, it is also
+        # the available subset of tasks
+        self.task_index = TaskIndex(lambda location: map.latlon_to_utm(location.lat, location.lon), task_index_cell_size)
+        # triggered when a task becomes available, idle fleet specialists wait for it (see wait_for_task)
+        self.task_available = env.event()
+        # global dispatch: requests of fleet specialists collected during one decision epoch, see request_task
+        self.dispatch_epoch = dispatch_epoch
+        self.dispatch_requests = []
         
     def add_fleet_specialist(self, fleet_specialist):
         """ Creates a fleet specialist and deploys to city """
@@ -11,42 +27,124 @@ class TaskManager:
     def add_task(self, task):
         """ Adds a task to the task manager """
         self.tasks.add(task)
+        self.update_task(task)
 
     def remove_task(self, task):
         """ Removes a task from the task manager """
         self.tasks.remove(task)
+        self.task_index.discard(task)
+
+    def update_task(self, task):
+        """ Updates the task index after the task's status or its vehicle's status or position has changed.
+        Called when a task becomes pending and when the vehicle of a task starts and ends a ride."""
+        if task in self.tasks and self.is_available(task):
+            self.task_index.update(task)
+            if not self.task_available.triggered:
+                self.task_available.succeed()
+        else:
+            self.task_index.discard(task)
+
+    @staticmethod
+    def is_available(task):
+        return task.vehicle.status != "riding" and task.status != "pending" and task.status != "assigned"
 
     def get_available_tasks(self):
-        """ Returns tasks that are not currently planned and for vehicles that are not riding"""
-        return self.tasks - set(task for task in self.tasks if task.vehicle.status == "riding" or task.status == "pending")
+        """ Returns tasks that are not currently planned and for vehicles that are not riding, as a new set"""
+        return set(self.task_index)
+
+    def has_available_tasks(self):
+        """ O(1) check if there is any available task """
+        return len(self.task_index) > 0
+
+    def iter_available_tasks(self):
+        """ Iterates over the available tasks without copying them, the tasks must not change during the iteration """
+        return iter(self.task_index)
+
+    def wait_for_task(self):
+        """ Returns an event that is triggered when a task becomes available: a new task, a task released
+        by a fleet specialist or the vehicle of a task ending its ride. Used when no task is available."""
+        if self.task_available.triggered:
+            self.task_available = self.env.event()
+        return self.task_available
+
+    def find_nearest_tasks(self, location, k=1, accept=None):
+        """ Returns the k available tasks nearest to location (straight line), nearest first.
+        accept is an optional filter on the tasks, see TaskIndex.nearest"""
+        return [task for _, task in self.task_index.nearest(location, k, accept)]
+
+    def request_task(self, fleet_specialist):
+        """ Requests a task for a fleet specialist from the global dispatch.
+        Returns an event with the assigned task as value, or None if other specialists got all available tasks.
+        All requests made within dispatch_epoch seconds of the first one are assigned together by dispatch."""
+        event = self.env.event()
+        self.dispatch_requests.append((fleet_specialist, event))
+        if len(self.dispatch_requests) == 1:
+            self.env.timeout(self.dispatch_epoch).callbacks.append(self.dispatch)
+        return event
+
+    def dispatch(self, event=None):
+        """ Assigns the available tasks to the requesting fleet specialists in one go.
+        Each specialist gives a row of costs to the tasks (see FleetSpecialist.dispatch_costs) and the assignment
+        with the minimum total cost is solved on the specialist-by-task matrix (Hungarian method). The assigned
+        tasks are reserved (status "assigned") until they are resolved or released, so no two specialists drive
+        to the same task."""
+        requests, self.dispatch_requests = self.dispatch_requests, []
+        tasks = list(self.task_index)
+        assigned = {}
+        if tasks:
+            lons, lats = Distance.location_coordinates([task.location for task in tasks])
+            costs = np.vstack([fleet_specialist.dispatch_costs(tasks, lons, lats) for fleet_specialist, _ in requests])
+            finite = np.isfinite(costs)
+            if not finite.all():
+                # unreachable tasks are only assigned if there is nothing else
+                largest = costs[finite].max() if finite.any() else 0
+                costs[~finite] = (largest + 1) * min(costs.shape)
+            rows, columns = linear_sum_assignment(costs)
+            assigned = {row: tasks[column] for row, column in zip(rows.tolist(), columns.tolist())}
+
+        for row, (fleet_specialist, request) in enumerate(requests):
+            task = assigned.get(row)
+            if task is not None:
+                self.assign_task(task)
+            request.succeed(task)
+
+    def assign_task(self, task):
+        """ Reserves a task for a fleet specialist, it is not available to others until it is released """
+        task.status = "assigned"
+        self.update_task(task)
+
+    def release_task(self, task):
+        """ Makes an assigned task available again, e.g. when its vehicle has been moved by a rider """
+        task.status = "active"
+        self.update_task(task)
 
     def log_remaining_tasks(self):
-        """ logs the remaining task to log file """
-        for task in self.tasks:
+        """ logs the remaining task to log file, by id (the set of tasks iterates in memory address order) """
+        for task in sorted(self.tasks, key=lambda task: task.id):
             self.save_task(task)
 
 
     def save_task(self, task, fleet_specialist=None, time_now=None):
-        task.set("task_id", task.id)
-        task.set("task_type", task.type)
-        task.set("bounty", task.bounty)
-        task.set("bounty_time", task.bounty_time)
-        task.set("vehicle_id", None if task.vehicle is None else task.vehicle.id)
-        task.set("priority", task.priority)
-        task.set("lon", task.location.lon, 5)
-        task.set("lat", task.location.lat, 5)
-        task.set("target_time", task.target_time,0)
-        task.set("created_time", task.created_time,0)
-        task.set("status", task.status)
-        task.set("resolved_by", None if fleet_specialist is None else fleet_specialist.id)
-        task.set("resolved_time", None if time_now is None else time_now)
-        task.set("time_spent", None if time_now is None else time_now - fleet_specialist.task_start_time)
-        task.set("distance_driven", None if fleet_specialist is None else fleet_specialist.task_distance_driven,0)
-        task.set("time_open",  None if time_now is None else time_now - task.created_time)
-        task.set("battery_in", task.battery_in, 3)
-        task.set("battery_out", task.battery_out, 3)
-
-        self.results.add_task(task)
+        # raw values, formatted when the results are written (see Task.header and Task.digits)
+        self.results.add_task({
+            "task_id": task.id,
+            "task_type": task.type,
+            "bounty": task.bounty,
+            "bounty_time": task.bounty_time,
+            "vehicle_id": None if task.vehicle is None else task.vehicle.id,
+            "priority": task.priority,
+            "lon": task.location.lon,
+            "lat": task.location.lat,
+            "target_time": task.target_time,
+            "created_time": task.created_time,
+            "status": task.status,
+            "resolved_by": None if fleet_specialist is None else fleet_specialist.id,
+            "resolved_time": None if time_now is None else time_now,
+            "time_spent": None if time_now is None else time_now - fleet_specialist.task_start_time,
+            "distance_driven": None if fleet_specialist is None else fleet_specialist.task_distance_driven,
+            "time_open": None if time_now is None else time_now - task.created_time,
+            "battery_in": task.battery_in,
+            "battery_out": task.battery_out})
     # Additional methods for managing tasks, specialists, etc. can be added here
 
 
@@ -0,0 +1,88 @@
+"""
+Ordering of the stops of a multi-stop route of a fleet specialist.
+
+The route starts at the specialist's location (node 0 of the distance matrix) and visits every other node once,
+without returning. It is built by nearest neighbour and improved by 2-opt: a segment of the route is reversed
+whenever that makes the route shorter, until no reversal helps. A reversal is evaluated in O(1) from the two
+changed edges and, since drive distance matrices are asymmetric, the change of the reversed segment read from
+prefix sums of the route in both directions. The route is reversed in place and the prefix sums are updated
+only when a reversal is taken, so a pass over all O(n^2) reversals costs O(n^2).
+"""
+
+import numpy as np
+
+
+def nearest_neighbor(distances):
+    """
+    Route that always goes to the nearest unvisited node.
+
+    Args:
+        distances (numpy.ndarray): Square matrix, distances[i, j] is the distance from node i to node j.
+
+    Returns:
+        list: The node indices in visiting order, starting with 0.
+    """
+    route = [0]
+    unvisited = set(range(1, len(distances)))
+    while unvisited:
+        current = route[-1]
+        nearest = min(unvisited, key=lambda node: (distances[current, node], node))
+        route.append(nearest)
+        unvisited.remove(nearest)
+    return route
+
+
+def route_length(distances, route):
+    return distances[route[:-1], route[1:]].sum()
+
+
+def direction_sums(distances, route):
+    """Prefix sums of the route's edges: forward[k] is the length of route[:k + 1], backward[k] the length of the
+    same nodes travelled in reverse."""
+    forward = [0.0]
+    backward = [0.0]
+    for a, b in zip(route[:-1], route[1:]):
+        forward.append(forward[-1] + distances[a][b])
+        backward.append(backward[-1] + distances[b][a])
+    return forward, backward
+
+
+def two_opt(distances, route):
+    """
+    Improves a route by reversing segments, the first node stays in place.
+
+    Reversing route[i:j + 1] replaces the edges (a, b) and (c, e) around the segment by (a, c) and (b, e), where
+    a = route[i - 1], b = route[i], c = route[j] and e = route[j + 1] (no edge if the segment ends the route),
+    and the segment is travelled backwards.
+
+    Args:
+        distances (numpy.ndarray): Square matrix, distances[i, j] is the distance from node i to node j.
+        route (list): The node indices in visiting order, starting with 0.
+
+    Returns:
+        list: The improved route.
+    """
+    distances = np.asarray(distances).tolist()  # plain floats, indexing numpy scalars is slow
+    route = list(route)
+    last = len(route) - 1
+    forward, backward = direction_sums(distances, route)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, last):
+            for j in range(i + 1, last + 1):
+                a, b, c = route[i - 1], route[i], route[j]
+                delta = distances[a][c] - distances[a][b] + (backward[j] - backward[i]) - (forward[j] - forward[i])
+                if j < last:
+                    e = route[j + 1]
+                    delta += distances[b][e] - distances[c][e]
+                if delta < -1e-9:
+                    route[i:j + 1] = route[i:j + 1][::-1]
+                    forward, backward = direction_sums(distances, route)
+                    improved = True
+    return route
+
+
+def plan_route(distances):
+    """Nearest neighbour route improved by 2-opt, see two_opt."""
+    return two_opt(distances, nearest_neighbor(distances))
@@ -0,0 +1,168 @@
+"""
+Structured tracing of simulation events, replacing eagerly formatted logging.info calls.
+
+Every traced event has a code, a category and the message format of its line in app.log. Each engine has its own
+Tracer (made and configured by its Results, closed with them), and callers check the flag of the category before
+doing any work for the arguments:
+
+    if self.tracer.rider:
+        self.tracer.emit(Trace.USER_INITIALIZED, self.env.now, self.id, parking_spot.id)
+
+so a disabled category costs one attribute check. An enabled event is either
+
+- "text": formatted and passed to logging.info, which gives the same app.log as before, or
+- "journal": packed as binary (event code, time, ids and numbers) into trace.bin. Decode it into the text of
+  app.log offline with: python Trace.py trace.bin [app.log]
+
+Strings in events are interned, a string record with its id is written the first time a string is seen.
+"""
+
+import logging
+import struct
+import sys
+
+
+CATEGORIES = ("simulation", "rider", "vehicle", "fleet", "diagnostic")
+# enabled unless configured otherwise: the events of the text app.log before tracing, "diagnostic" holds new ones
+DEFAULT_CATEGORIES = ("simulation", "rider", "vehicle", "fleet")
+
+# event code -> (category, message format, argument types), the time is always the first argument
+# argument types: "i" integer, "d" float, "s" string
+EVENTS = {}
+
+
+def define(code, category, message, arguments=""):
+    EVENTS[code] = (category, message, arguments)
+    return code
+
+
+STRING = 0  # journal record defining an interned string
+
+PARKING_SPOTS_PLACED = define(1, "simulation", "[%.0f] Number of parking spots placed: %d. Number of vehicles: %d. Number of vehicles per parking spot: %.2f", "iid")
+FLEET_SPECIALISTS_INITIALIZED = define(2, "simulation", "[%.0f] Number of fleet specialists initilised: %d", "i")
+TRIPS_PLANNED = define(3, "simulation", "[%.0f] Number of trips planned is %d under %d day(s). TVD: %d", "idd")  # the days and TVD may be floats
+DEMAND_FEEDER_DONE = define(4, "diagnostic", "[%.0f] Demand feeder done, %d trips injected", "i")
+
+USER_INITIALIZED = define(10, "rider", "[%.0f] User %d initialized at parking spot %d", "ii")
+USER_NO_VEHICLE = define(11, "rider", "[%.0f] User %d has no available vehicle at parking spot %d", "ii")
+USER_RIDING = define(12, "rider", "[%.0f] User %d riding vehicle %d from parking spot %d to %d", "iiii")
+USER_PARKING = define(13, "rider", "[%.0f] User %d parking vehicle %d at parking spot %d", "iii")
+
+TASK_CREATED = define(20, "vehicle", "[%.0f] Vehicle %d - Task '%s' created. Battery level is %.2f.", "isd")
+
+FLEET_SPECIALIST_DRIVING = define(30, "fleet", "[%.0f] Fleet Specialist %d is driving from location [%.4f, %.4f]", "idd")
+FLEET_SPECIALIST_ARRIVED = define(31, "fleet", "[%.0f] Fleet Specialist %d arrived at location [%.4f, %.4f]", "idd")
+TASK_RESOLVED = define(32, "fleet", "[%.0f] Task %d resolved by swapping to a full battery at location [%.4f, %.4f]", "idd")
+FLEET_SPECIALIST_INITIALIZED = define(33, "fleet", "[%.0f] Fleet Specialist %d initialized at location [%.4f, %.4f]", "idd")
+FLEET_SPECIALIST_MISSED_TASK = define(34, "fleet", "[%.0f] Fleet specilist %d missed task.", "i")
+FLEET_SPECIALIST_WAITING = define(35, "fleet", "[%.0f] Fleet Specialist %d is waiting for tasks", "i")
+FLEET_SPECIALIST_REFILLING = define(36, "fleet", "[%.0f] Fleet Specialist %d is out of batteries, will go and refill att WH", "i")
+FLEET_SPECIALIST_REFILLED = define(37, "fleet", "[%.0f] Fleet Specialist %d has now replenished batteries", "i")
+TOUR_PLANNED = define(38, "diagnostic", "[%.0f] Fleet Specialist %d planned a tour of %d tasks", "ii")
+
+HEADER = struct.Struct("<H")  # event code
+STRING_RECORD = struct.Struct("<HII")  # STRING, string id, length in bytes
+# event code -> struct of the whole record: code, time, arguments
+RECORDS = {code: struct.Struct("<Hd" + arguments.replace("i", "q").replace("s", "I")) for code, (_, _, arguments) in EVENTS.items()}
+
+
+class Tracer:
+    """
+    The switch board of the traced events, one flag per category (tracer.rider, tracer.fleet, ...).
+    All categories are disabled until configure is called.
+    """
+    def __init__(self):
+        self.mode = None
+        self.file = None
+        self.buffer = bytearray()
+        self.buffer_size = 1 << 16
+        self.strings = {}
+        for category in CATEGORIES:
+            setattr(self, category, False)
+
+    def configure(self, categories=DEFAULT_CATEGORIES, mode="text", path=None, buffer_size=1 << 16):
+        """
+        Args:
+            categories (iterable): The enabled categories, the others are disabled.
+            mode (str): "text" to log the messages with logging.info, "journal" to write them to a binary file.
+            path (str): The journal file, for mode "journal".
+            buffer_size (int): Bytes of journal buffered before they are written.
+        """
+        self.close()
+        if mode not in ("text", "journal"):
+            raise ValueError(f"Unknown trace mode: {mode}")
+        self.mode = mode
+        self.buffer_size = buffer_size
+        self.strings = {}
+        if mode == "journal":
+            self.file = open(path, "wb")
+        for category in CATEGORIES:
+            setattr(self, category, category in categories)
+
+    def emit(self, code, time, *arguments):
+        """Traces an event, call it only if the category of the event is enabled."""
+        if self.mode == "text":
+            logging.info(EVENTS[code][1] % ((time,) + arguments))
+            return
+        if "s" in EVENTS[code][2]:
+            arguments = tuple(self.intern(argument) if kind == "s" else argument
+                              for argument, kind in zip(arguments, EVENTS[code][2]))
+        self.buffer += RECORDS[code].pack(code, time, *arguments)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def intern(self, string):
+        string_id = self.strings.get(string)
+        if string_id is None:
+            string_id = self.strings[string] = len(self.strings)
+            data = string.encode("utf-8")
+            self.buffer += STRING_RECORD.pack(STRING, string_id, len(data)) + data
+        return string_id
+
+    def flush(self):
+        if self.file is not None and self.buffer:
+            self.file.write(self.buffer)
+        self.buffer = bytearray()
+
+    def close(self):
+        """Writes the rest of the journal and disables all categories."""
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.mode = None
+        for category in CATEGORIES:
+            setattr(self, category, False)
+
+
+
+def decode(path):
+    """Yields the app.log messages of a journal file, in the order the events were traced."""
+    with open(path, "rb") as file:
+        data = file.read()
+    strings = {}
+    position = 0
+    while position < len(data):
+        (code,) = HEADER.unpack_from(data, position)
+        if code == STRING:
+            _, string_id, length = STRING_RECORD.unpack_from(data, position)
+            position += STRING_RECORD.size
+            strings[string_id] = data[position:position + length].decode("utf-8")
+            position += length
+            continue
+        record = RECORDS[code]
+        values = record.unpack_from(data, position)[1:]
+        position += record.size
+        _, message, arguments = EVENTS[code]
+        if "s" in arguments:
+            values = values[:1] + tuple(strings[value] if kind == "s" else value for value, kind in zip(values[1:], arguments))
+        yield message % values
+
+
+if __name__ == "__main__":
+    # Decodes a journal into the text of app.log: python Trace.py trace.bin [app.log]
+    output = open(sys.argv[2], "w") if len(sys.argv) > 2 else sys.stdout
+    for line in decode(sys.argv[1]):
+        output.write(line + "\n")
+    if output is not sys.stdout:
+        output.close()
@@ -1,8 +1,9 @@
 import simpy
 from Task import Task
-import logging
+import Trace
 
 from Battery import Battery
+from FleetState import FleetState
 
 class Vehicle:
     # static variables:
@@ -10,20 +11,31 @@ class Vehicle:
     version: str = "V7"
     id_count = -1
 
-    def __init__(self, env, map, config, data_interface, task_manager, parking_spot, battery_level=1.0):
+    def __init__(self, env, map, config, data_interface, task_manager, parking_spot, battery_level=1.0, battery_scheduler=None,
+                 fleet_state=None, index=None, tracer=None):
         # instance variables
         self.next_id()
         self.id = Vehicle.id_count
 
+        # status, task, parking spot and battery are stored in the row index of the fleet state (a private one if not given)
+        if fleet_state is None:
+            fleet_state = FleetState()
+        if index is None:
+            index = fleet_state.add_vehicle(battery_level, parking_spot.id)
+        self.fleet_state = fleet_state
+        self.index = index
+
         self.env = env
         self.map = map
         self.config = config
         self.data_interface = data_interface
         self.task_manager = task_manager
+        self.tracer = tracer if tracer is not None else Trace.Tracer()  # the engine's, or one with all events disabled
 
         self.riding_speed = self.config["RIDING_SPEED"] / 3.6 # km/h -> m/s conversion
 
-        self.battery = Battery(self.config["DISCHARGE_RATE_RIDE_KM"], self.config["DISCHARGE_RATE_IDLE_HR"], battery_level)
+        self.battery = Battery(self.config["DISCHARGE_RATE_RIDE_KM"], self.config["DISCHARGE_RATE_IDLE_HR"], battery_level,
+                               fleet_state=fleet_state, index=index)
         self.available: bool = True
         self.status = "ready"
         self.task = None
@@ -32,9 +44,11 @@ class Vehicle:
         # if battery is initlized below swap threshold a swap should be added
         self.check_maintenance_need()
 
-        # handling the idle drain of battery
+        # handling the idle drain of battery, by an idle process or by the fleet's BatteryScheduler
+        self.battery_scheduler = battery_scheduler
         self.idle_start = None
-        self.idle_process = self.env.process(self.idle())   
+        self.idle_process = None
+        self.resume_idle()
 
     @classmethod
     def reset(cls):
@@ -43,18 +57,47 @@ class Vehicle:
     def next_id(self):
         Vehicle.id_count += 1
 
+    @property
+    def status(self):
+        return FleetState.STATUSES[self.fleet_state.status.item(self.index)]
+
+    @status.setter
+    def status(self, status):
+        self.fleet_state.status[self.index] = FleetState.STATUS_CODES[status]
+
+    @property
+    def task(self):
+        return self._task
+
+    @task.setter
+    def task(self, task):
+        self._task = task
+        if task is None:
+            self.fleet_state.set_task(self.index, FleetState.NO_TASK)
+        else:
+            self.fleet_state.set_task(self.index, FleetState.BOUNTY_TASK if task.bounty else FleetState.TASK)
+
+    @property
+    def parking_spot(self):
+        return self._parking_spot
+
+    @parking_spot.setter
+    def parking_spot(self, parking_spot):
+        self._parking_spot = parking_spot
+        self.fleet_state.set_parking_spot(self.index, -1 if parking_spot is None else parking_spot.id)
+
     def __str__(self) -> str:
         return f"Id: {self.id:<7} Available: {'True' if self.available else 'False':<7}  Battery: {self.battery.level:.2f} Current Parking Spot: {self.parking_spot.id:<5}"
         
-    def ride(self, destination_parking_spot, distance):
-        # Ride the vehicle
+    def start_ride(self, destination_parking_spot, distance):
+        """Sets the ride distance (routed if not given) and returns the ride time in seconds."""
         if distance != None:
             self.ride_distance = distance
         else:
             self.ride_distance = self.map.get_bike_ride_distance(self.parking_spot.location, destination_parking_spot.location)
-        
-        time = round(self.ride_distance / self.riding_speed)
-        yield self.env.timeout(time)
+        return round(self.ride_distance / self.riding_speed)
+
+    def end_ride(self):
         # Update the battery
         self.battery.discharge_ride(self.ride_distance)
 
@@ -65,6 +108,7 @@ class Vehicle:
         # Check if battery level is below the threshold for bounty
         if self.battery.level <= self.config["BOUNTY_THRESHOLD"]:
             self.task.bounty = True
+            self.fleet_state.set_task(self.index, FleetState.BOUNTY_TASK)
             self.task.bounty_time = self.env.now
             self.status = "bounty"
     
@@ -72,51 +116,74 @@ class Vehicle:
         """Sets the availability of the vehicle based on the tasks it has.
         If there is a bounty task, the vehicle is not available."""
         if self.task is None:
-            self.available = True
+            self.set_available(True)
         else:
-            self.available = not self.task.bounty
+            self.set_available(not self.task.bounty)
+
+    def set_available(self, available):
+        """Sets the availability and keeps the available vehicle index of the parking spot in sync."""
+        self.available = available
+        self.parking_spot.update_availability(self)
 
     def generate_task(self, task_type):
         # Logic to generate a maintenance task for battery swap, not bounty to begin with
         self.task = Task(task_type, self.env.now, self, battery_in=self.battery.level)
         self.task_manager.add_task(self.task)
-        logging.info("[%.0f] Vehicle %d - Task '%s' created. Battery level is %.2f." % (self.env.now, self.id, task_type, self.battery.level))
+        if self.tracer.vehicle:
+            self.tracer.emit(Trace.TASK_CREATED, self.env.now, self.id, task_type, self.battery.level)
+
+    def next_idle_update(self):
+        """Returns the next threshold the idle battery drains to and the time in seconds until it is reached."""
+        if self.battery.level > self.config["SWAP_THRESHOLD"]:
+            next_update_level = self.config["SWAP_THRESHOLD"]
+        elif self.battery.level > self.config["BOUNTY_THRESHOLD"]:
+            next_update_level = self.config["BOUNTY_THRESHOLD"]
+        else:
+            next_update_level = 0
+
+        # Calculate the time in hours until the battery reaches the swap threshold
+        time_until_next_update = round((self.battery.level - next_update_level) / self.battery.discharge_rate_idle)
+        return next_update_level, time_until_next_update
+
+    def reach_idle_level(self, next_update_level):
+        """Called when the idle battery has drained to the next threshold."""
+        self.battery.level = next_update_level  # Update battery level to swap threshold
+        self.check_maintenance_need()
+        self.update_availability()
+        # Resume idle (if not battery is empty)
+        if self.battery.level > 0:
+            self.resume_idle()
 
     def idle(self):
         try:
-            if self.battery.level > self.config["SWAP_THRESHOLD"]:
-                next_update_level = self.config["SWAP_THRESHOLD"]
-            elif self.battery.level > self.config["BOUNTY_THRESHOLD"]:
-                next_update_level = self.config["BOUNTY_THRESHOLD"]
-            else:
-                next_update_level = 0
-
-            # Calculate the time in hours until the battery reaches the swap threshold
-            time_until_next_update = round((self.battery.level - next_update_level) / self.battery.discharge_rate_idle)
+            next_update_level, time_until_next_update = self.next_idle_update()
 
             self.idle_start = self.env.now
             yield self.env.timeout(time_until_next_update)
-            self.battery.level = next_update_level  # Update battery level to swap threshold
-            self.check_maintenance_need()
-            self.update_availability()
-            # Resume idle (if not battery is empty)
-            if self.battery.level > 0:
-                self.resume_idle()
+            self.reach_idle_level(next_update_level)
 
         except simpy.exceptions.Interrupt as interrupt:
-            # time scooter been idle 
-            time_idle = self.env.now - self.idle_start
-            
-            # drain battery
-            self.battery.discharge_idle(time_idle)
+            pass  # the battery was drained by interrupt_idle_process
 
     def interrupt_idle_process(self, interrupt_message):
-        """Interrupts the idle process if it is alive and not already terminated."""
+        """Interrupts the idle process if it is alive and not already terminated.
+        The idle drain is applied at once, so the caller continues with the current battery level."""
         if self.idle_process is not None and not self.idle_process.triggered:
-            self.idle_process.interrupt(interrupt_message)
+            if self.battery_scheduler is not None:
+                self.battery_scheduler.interrupt(self.idle_process)
+            else:
+                if self.idle_start is not None:  # None if interrupted before the idle process started
+                    # drain battery for the time the scooter has been idle
+                    self.battery.discharge_idle(self.env.now - self.idle_start)
+                    self.idle_start = None
+                self.idle_process.interrupt(interrupt_message)
 
     def resume_idle(self):
         """Resume idle mode for the vehicle."""
-        self.idle_process = self.env.process(self.idle())
+        if self.battery_scheduler is not None:
+            self.idle_process = self.battery_scheduler.start_idle(self)
+        else:
+            self.idle_start = None  # set when the idle process starts
+            self.idle_process = self.env.process(self.idle())
 
 
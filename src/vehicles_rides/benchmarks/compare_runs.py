@@ -0,0 +1,165 @@
+"""
+Runs the simulation twice on a fixed seed and byte-compares the result files of the two runs.
+
+The runs use a small synthetic town that needs no network access: a grid street graph over the bounding box of an
+area polygon (stored in a GraphStore cache, the map runs in cache only mode), random parking spots inside the
+polygon and uniform demand. Each run is a config override (e.g. BATTERY_MODEL or ENGINE) and optionally another
+source tree, e.g. a git worktree of an older commit, so a change can be checked against the model before it:
+
+    python compare_runs.py --a '{"BATTERY_MODEL": "process"}' --b '{"BATTERY_MODEL": "lazy"}'
+    python compare_runs.py --source-a /tmp/before/src/vehicles_rides --a '{}' --b '{}'
+
+Every run is a subprocess in its own working directory, so the two source trees never share imported modules.
+"""
+
+import argparse
+import filecmp
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AREA_PATH = os.path.join(os.path.dirname(os.path.dirname(SOURCE_DIR)), "data", "area", "example.geojson")
+RESULT_FILES = ("vehicle_rides.csv", "task_data.csv", "state_records.csv")
+
+CONFIG = {
+    "CITY": "synthetic",
+    "NUM_OF_VEHICLES": 300,
+    "TVD": 4,
+    "NUM_SIMULATED_DAYS": 3,
+    "RIDING_SPEED": 12,
+    "DISCHARGE_RATE_RIDE_KM": 0.05,
+    "DISCHARGE_RATE_IDLE_HR": 0.005,
+    "SWAP_THRESHOLD": 0.34,
+    "BOUNTY_THRESHOLD": 0.14,
+    "LOCK_THRESHOLD": 0.076,
+    "WALK_RADIUS": 300,
+    "NUM_OF_FLEET_SPECIALISTS": 2,
+    "AVG_FLEET_SPECIALIST_TRAVEL_SPEED": 15,
+    "TIME_PER_SWAP_SINGLE": 845,
+    "TIME_PER_SWAP_MULTIPLE": 222,
+    "REFILL_VAN_BATTERIES_TIME": 8986,
+    "VAN_BATTERY_CAPACITY": 100,
+    "GRAPH_CACHE_ONLY": True,
+}
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(a))
+
+
+def build_town(town_dir, num_parking_spots, grid_size=30, seed=0):
+    """Writes the graph cache (drive and bike: the same grid) and the parking spots csv of the synthetic town."""
+    import networkx as nx
+    from shapely.geometry import Point, shape
+
+    from GraphStore import GraphStore
+
+    with open(AREA_PATH) as f:
+        area_dict = json.load(f)
+    polygon = shape(area_dict)
+    min_lon, min_lat, max_lon, max_lat = polygon.bounds
+
+    graph = nx.MultiDiGraph(crs="epsg:4326")
+    lons = [min_lon + (max_lon - min_lon) * i / (grid_size - 1) for i in range(grid_size)]
+    lats = [min_lat + (max_lat - min_lat) * j / (grid_size - 1) for j in range(grid_size)]
+    for i, lon in enumerate(lons):
+        for j, lat in enumerate(lats):
+            graph.add_node(i * grid_size + j, x=lon, y=lat)
+    for i in range(grid_size):
+        for j in range(grid_size):
+            for di, dj in ((1, 0), (0, 1)):
+                if i + di < grid_size and j + dj < grid_size:
+                    u, v = i * grid_size + j, (i + di) * grid_size + j + dj
+                    length = haversine(lons[i], lats[j], lons[i + di], lats[j + dj])
+                    graph.add_edge(u, v, length=length)
+                    graph.add_edge(v, u, length=length)
+
+    graph_store = GraphStore(os.path.join(town_dir, "graphs"))
+    for network_type in ("drive", "bike"):
+        graph_store.save(GraphStore.get_key(area_dict, network_type), graph)
+
+    rng = random.Random(seed)
+    with open(os.path.join(town_dir, "parking_spots.csv"), "w") as f:
+        f.write("LATITUDE,LONGITUDE\n")
+        num_placed = 0
+        while num_placed < num_parking_spots:
+            lon, lat = rng.uniform(min_lon, max_lon), rng.uniform(min_lat, max_lat)
+            if polygon.contains(Point(lon, lat)):
+                f.write(f"{lat!r},{lon!r}\n")
+                num_placed += 1
+
+
+def run_single(town_dir, overrides, seed):
+    """Runs one simulation in the current directory, prints the results path, run time and scheduled events."""
+    import time
+
+    from Simulationclass import RideSimulationEngine
+
+    config = dict(CONFIG, GRAPH_CACHE_DIR=os.path.join(town_dir, "graphs"), **overrides)
+    engine = RideSimulationEngine(config, os.path.join(town_dir, "parking_spots.csv"), AREA_PATH, verbose=0,
+                                  fleet_maintenance=config["NUM_OF_FLEET_SPECIALISTS"], seed=seed)
+    start = time.perf_counter()
+    engine.run(config["NUM_SIMULATED_DAYS"] * 3600 * 24)
+    elapsed = time.perf_counter() - start
+    # events scheduled: the event id counter of the environment
+    num_events = engine.env.eid if hasattr(engine.env, "eid") else next(engine.env._eid)
+    print(json.dumps({"path": engine.results.path, "time": elapsed, "events": num_events}))
+
+
+def run(source_dir, town_dir, overrides, seed):
+    work_dir = tempfile.mkdtemp(prefix="run_")
+    os.mkdir(os.path.join(work_dir, "results"))  # Results writes to results/<timestamp> of the working directory
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--single", "--town", town_dir, "--config", json.dumps(overrides),
+         "--seed", str(seed)],
+        cwd=work_dir, env=dict(os.environ, PYTHONPATH=source_dir), capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--a", default="{}", help="config overrides of run a (json)")
+    parser.add_argument("--b", default="{}", help="config overrides of run b (json)")
+    parser.add_argument("--source-a", default=SOURCE_DIR, help="source tree of run a")
+    parser.add_argument("--source-b", default=SOURCE_DIR, help="source tree of run b")
+    parser.add_argument("--parking-spots", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--town", help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args.town, json.loads(args.config), args.seed)
+        return
+
+    sys.path.insert(0, SOURCE_DIR)
+    town_dir = tempfile.mkdtemp(prefix="town_")
+    build_town(town_dir, args.parking_spots)
+    runs = []
+    for name, source_dir, overrides in (("a", args.source_a, args.a), ("b", args.source_b, args.b)):
+        result = run(os.path.abspath(source_dir), town_dir, json.loads(overrides), args.seed)
+        print("%s: %s %s, %.2f s, %d events scheduled, %.0f events/s"
+              % (name, source_dir, overrides, result["time"], result["events"], result["events"] / result["time"]))
+        runs.append(result)
+
+    identical = True
+    for file_name in RESULT_FILES:
+        path_a, path_b = (os.path.join(result["path"], file_name) for result in runs)
+        with open(path_a) as f:
+            num_lines = sum(1 for _ in f)
+        same = filecmp.cmp(path_a, path_b, shallow=False)
+        identical = identical and same
+        print("%-18s %7d lines  %s" % (file_name, num_lines, "identical" if same else "DIFFERENT"))
+    sys.exit(0 if identical else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark of the rider lifecycle: events scheduled per trip and trips per second.
+
+Compares Rider against the former nested structure, where init, ride, vehicle ride and parking each ran in a
+sub-process. 100k trips on 500 parking spots and 2000 vehicles, without a map and without battery tasks:
+
+    python rider_events.py
+"""
+
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import simpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Datainterface import DataInterface
+from DemandFeeder import DemandFeeder
+from Location import Location
+from ParkingSpotclass import ParkingSpot
+from Rider import Rider
+from TaskManager import TaskManager
+import Trace
+from Vehicleclass import Vehicle
+
+
+class NestedRider(Rider):
+    """The rider as it was before: init, ride, vehicle ride and parking each in a sub-process."""
+    def start(self):
+        self.env.process(self.process())
+
+    def process(self):
+        yield self.env.process(self.nested_init_user())
+        self.vehicle = self.origin_parking_spot.pick_available_vehicle()
+        if self.vehicle is None:
+            self.save_user_ride()
+            return
+        self.vehicle.interrupt_idle_process("Idle interrupted due to RIDE")
+        yield self.env.process(self.nested_ride_vehicle())
+        yield self.env.process(self.nested_park_vehicle())
+        self.status = "completed"
+        self.save_user_ride()
+
+    def nested_init_user(self):
+        yield self.env.timeout(max(0, self.departure_time - self.env.now))
+        self.init_user()
+
+    def nested_ride_vehicle(self):
+        self.battery_in = self.vehicle.battery.level
+        ride_start = self.env.now
+        yield self.env.process(self.nested_vehicle_ride())
+        self.vehicle.resume_idle()
+        self.time_ride = self.env.now - ride_start
+        self.battery_out = self.vehicle.battery.level
+        self.ride_distance = self.vehicle.ride_distance
+        self.location = self.destination_parking_spot.location
+
+    def nested_vehicle_ride(self):
+        self.data_interface.start_vehicle_ride(self.vehicle)
+        yield self.env.process(self.nested_vehicle_ride_timeout())
+        self.data_interface.end_vehicle_ride(self.vehicle, self.destination_parking_spot)
+
+    def nested_vehicle_ride_timeout(self):
+        yield self.env.timeout(self.vehicle.start_ride(self.destination_parking_spot, self.ride_distance))
+        self.vehicle.end_ride()
+
+    def nested_park_vehicle(self):
+        yield self.env.timeout(30)
+
+
+class CountingEnvironment(simpy.Environment):
+    """Counts the scheduled events, every allocated event is scheduled once."""
+    num_events = 0
+
+    def schedule(self, event, priority=simpy.events.NORMAL, delay=0):
+        self.num_events += 1
+        super().schedule(event, priority, delay)
+
+
+class NoNeighbors:
+    def get_neighbor_indices(self, id):
+        return np.empty(0, dtype=np.int32)
+
+
+class NoResults:
+    tracer = Trace.Tracer()  # all events disabled
+
+    def add_user_trip(self, ride):
+        pass
+
+
+# no battery tasks, the benchmark runs without a map
+CONFIG = {"WALK_RADIUS": 200, "RIDING_SPEED": 15, "DISCHARGE_RATE_RIDE_KM": 0, "DISCHARGE_RATE_IDLE_HR": 0.001,
+          "SWAP_THRESHOLD": 0.2, "BOUNTY_THRESHOLD": 0.05}
+
+
+def simulate(env, rider_class, num_trips=100000, num_spots=500, num_vehicles=2000):
+    random.seed(1)
+    ParkingSpot.reset(); Vehicle.reset(); Rider.reset()
+    results = NoResults()
+    data_interface = DataInterface(env, CONFIG, NoNeighbors())
+    data_interface.task_manager = TaskManager(env, results, None)
+    parking_spots = [ParkingSpot(Location(random.uniform(18.0, 18.1), random.uniform(59.3, 59.4))) for _ in range(num_spots)]
+    data_interface.parking_spots = parking_spots
+    for _ in range(num_vehicles):
+        parking_spot = random.choice(parking_spots)
+        vehicle = Vehicle(env, None, CONFIG, data_interface, data_interface.task_manager, parking_spot)
+        parking_spot.add_vehicle(vehicle)
+    trips = sorted((random.randint(0, 24 * 3600), random.randrange(num_spots), random.randrange(num_spots),
+                    None, random.uniform(300, 5000)) for _ in range(num_trips))
+
+    def create_rider(departure_time, origin, destination, target_time, ride_distance):
+        return rider_class(env, CONFIG, data_interface, results, parking_spots[origin], parking_spots[destination],
+                           departure_time, target_time, ride_distance)
+
+    DemandFeeder(env, trips, create_rider).start()
+    start = time.perf_counter()
+    env.run(25 * 3600)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    for rider_class in (NestedRider, Rider):
+        env = CountingEnvironment()
+        simulate(env, rider_class)
+        events = env.num_events
+        elapsed = simulate(simpy.Environment(), rider_class)
+        print("%-11s %d events scheduled (%.1f per trip), %.2f s, %.0f trips/s"
+              % (rider_class.__name__, events, events / 100000, elapsed, 100000 / elapsed))
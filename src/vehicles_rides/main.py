@@ -15,7 +15,12 @@ parking_spot_data_path = os.path.join("data", "parking_spots", config["CITY"] +"
 demand_data_path = os.path.join("data", "demand", config["CITY"] + ".csv")
 
 print("Setting up map")
-map = Map(area_ploygon_path)
+map = Map(area_ploygon_path, graph_cache_dir=config.get("GRAPH_CACHE_DIR"), cache_only=config.get("GRAPH_CACHE_ONLY", False),
+          routing_backend=config.get("ROUTING_BACKEND", "csr"),
+          routing_cache_size=config.get("ROUTING_CACHE_SIZE", 16384),
+          routing_cache_policy=config.get("ROUTING_CACHE_POLICY", "lru"),
+          routing_cache_path=config.get("ROUTING_CACHE_PATH"),
+          distance_matrix_max_nodes=config.get("DISTANCE_MATRIX_MAX_NODES", 4096))
 print("Initilizing parking spots")
 parking_spots, map = RideSimulationEngine.load_parking_spots(parking_spot_data_path, map)
 parking_spots = RideSimulationEngine.find_parking_spot_neighbors(config, parking_spots, map)
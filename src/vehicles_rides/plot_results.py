@@ -16,8 +16,14 @@ def get_result_dirs(base_path="results"):
     return dirs
 
 def read_data(directory, file):
-    data_path = os.path.join(directory, file)
-    return pd.read_csv(data_path)
+    """ Reads a result table written in any of the formats of Results (csv, parquet or arrow).
+    file is the table's file name with any extension, e.g. "vehicle_rides.csv" """
+    name = os.path.splitext(file)[0]
+    for extension, reader in ((".parquet", pd.read_parquet), (".arrow", pd.read_feather), (".csv", pd.read_csv)):
+        data_path = os.path.join(directory, name + extension)
+        if os.path.exists(data_path):
+            return reader(data_path)
+    raise FileNotFoundError(os.path.join(directory, file))
 
 def aggregate_data(data, attribute, interval):
     # Convert the attribute to float first to clear any existing format issues
@@ -67,7 +73,7 @@ def plot_task_completion_over_time(directories, interval='1h'):
     plt.show()
 
 def process_task_data(cur_dir, origin_date, window_size):
-    df = pd.read_csv(os.path.join(cur_dir, "task_data.csv"))
+    df = read_data(cur_dir, "task_data.csv")
     events = []
     for _, row in df.iterrows():
         events.append((row['created_time'], 1))  # Task creation increases open tasks
@@ -165,8 +171,8 @@ def plot_vehicle_state_over_time(directory):
     NUM_OF_VEHICLES = config['NUM_OF_VEHICLES']
 
     # Load data
-    vehicle_rides = pd.read_csv(f"{directory}/vehicle_rides.csv")
-    task_data = pd.read_csv(f"{directory}/task_data.csv")
+    vehicle_rides = read_data(directory, "vehicle_rides.csv")
+    task_data = read_data(directory, "task_data.csv")
     
 
     # Convert times to datetime
@@ -220,14 +226,10 @@ def plot_vehicle_state_over_time(directory):
 def get_table_of_key_performance_indicators(directories, start_from_time=0):
     kpi_results = []
     for directory in directories:
-        task_data_path = os.path.join(directory, 'task_data.csv')
-        vehicle_rides_path = os.path.join(directory, 'vehicle_rides.csv')
-        state_data_path = os.path.join(directory, "state_records.csv")
-
         # Read data
-        task_data = pd.read_csv(task_data_path)
-        vehicle_rides = pd.read_csv(vehicle_rides_path)
-        state_data = pd.read_csv(state_data_path)
+        task_data = read_data(directory, 'task_data.csv')
+        vehicle_rides = read_data(directory, 'vehicle_rides.csv')
+        state_data = read_data(directory, "state_records.csv")
         # Read config data
         config_path = os.path.join(directory, 'config.json')
         with open(config_path, 'r') as config_file:
@@ -286,8 +288,7 @@ def get_table_of_key_performance_indicators(directories, start_from_time=0):
     return pd.DataFrame(kpi_results)
 
 def plot_fleet_route(m, directory, fleet_specialist_id, start_day=3, duration_hours=3, color='purple'):
-    file_path = os.path.join(directory, "task_data.csv")
-    data = pd.read_csv(file_path)
+    data = read_data(directory, "task_data.csv")
     config_path = os.path.join(directory, 'config.json')
     
     with open(config_path, 'r') as config_file: